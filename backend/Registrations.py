@@ -1,41 +1,27 @@
-from fastapi import APIRouter, HTTPException, status
-from pydantic import BaseModel
+from fastapi import APIRouter, Depends, HTTPException, status
+from pydantic import BaseModel, Field, model_validator
 from typing import List, Optional, Dict, Any
 from web3 import Web3
-from web3.middleware import geth_poa_middleware
-import json
+from web3.exceptions import ContractLogicError
+from blockchain import CONTRACT_ADDRESS, get_account_from_private_key, send_transaction
+import blockchain
+from ratelimit import limit_reads, limit_writes
+from health import readiness
+from rpcbatch import batch_call
+from singleflight import reads
+from indexer import events_mode, logged_messages
+from sendqueue import sends, batch_gas_limit
+import blobstore
+import asyncio
 import os
 try:
-    from config import BLOCKCHAIN_RPC_URL, CONTRACT_ADDRESS as CONFIG_CONTRACT_ADDRESS
+    from config import MAX_BATCH_ADDRESSES
 except ImportError:
     # Fallback for local development
-    BLOCKCHAIN_RPC_URL = os.getenv("BLOCKCHAIN_RPC_URL", "http://127.0.0.1:7545")
-    CONFIG_CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS", "0xa2691703072E2821b9EE1698F05309289FA226c1")
+    MAX_BATCH_ADDRESSES = int(os.getenv("MAX_BATCH_ADDRESSES", "500"))
 
 app = APIRouter()
 
-# Initialize Web3 connection
-w3 = Web3(Web3.HTTPProvider(BLOCKCHAIN_RPC_URL))
-w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
-# Load contract ABI from build artifacts
-contract_path = os.path.join(os.path.dirname(__file__), 'build', 'contracts', 'Whatsapp.json')
-if not os.path.exists(contract_path):
-    # Try parent directory for local development
-    contract_path = os.path.join(os.path.dirname(__file__), '..', 'build', 'contracts', 'Whatsapp.json')
-
-with open(contract_path, 'r') as f:
-    contract_data = json.load(f)
-    contract_abi = contract_data['abi']
-
-# Contract address from config
-CONTRACT_ADDRESS = CONFIG_CONTRACT_ADDRESS
-
-# Initialize contract instance (will be set when address is provided)
-contract = None
-if CONTRACT_ADDRESS and CONTRACT_ADDRESS != "":
-    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=contract_abi)
-
 
 # ==================== Pydantic Models ====================
 
@@ -51,6 +37,9 @@ class UserResponse(BaseModel):
     user_address: str
     status_expiry: int
 
+class BatchUserRequest(BaseModel):
+    addresses: List[str]
+
 class MessageModel(BaseModel):
     from_address: str
     to_address: str
@@ -73,71 +62,93 @@ class ReadMessageModel(BaseModel):
 class ChatMessagesRequest(BaseModel):
     user1_address: str
     user2_address: str
+    from_ts: Optional[int] = Field(None, ge=0)  # Unix timestamp, inclusive
+    to_ts: Optional[int] = Field(None, ge=0)  # Unix timestamp, inclusive
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.from_ts is not None and self.to_ts is not None and self.from_ts > self.to_ts:
+            raise ValueError("from_ts must not be after to_ts")
+        return self
 
 
 # ==================== Helper Functions ====================
 
-def calculate_chat_id(user1_address: str, user2_address: str) -> bytes:
-    """Calculate chat ID from two user addresses"""
-    addr1 = user1_address.lower().replace('0x', '')
-    addr2 = user2_address.lower().replace('0x', '')
-    packed_data = addr1 + addr2
-    return w3.keccak(hexstr=packed_data)
+MAX_UINT256 = 2 ** 256 - 1
 
-def check_contract_initialized():
-    """Check if contract is initialized"""
-    if not contract:
-        raise HTTPException(
-            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
-            detail="Contract not initialized. Please set CONTRACT_ADDRESS in backend/Registrations.py"
+def calculate_chat_id(user1_address: str, user2_address: str) -> bytes:
+    """Calculate chat ID from two user addresses (the same for either order)"""
+    return blockchain.chat_id_for(user1_address, user2_address)
+
+async def fetch_chat_messages(chat_id: bytes, from_ts: Optional[int], to_ts: Optional[int]):
+    """Fetch a chat's messages, using the binary-search range view when a time filter is set"""
+    # Concurrent polls of the same chat share one in-flight eth_call
+    if from_ts is None and to_ts is None:
+        messages = await reads.do(
+            "getChatMessages", chat_id,
+            lambda: blockchain.contract.functions.getChatMessages(chat_id).call()
+        )
+        return 0, messages
+    from_ts = from_ts if from_ts is not None else 0
+    to_ts = to_ts if to_ts is not None else MAX_UINT256
+    return await reads.do(
+        "getChatMessagesInRange", (chat_id, from_ts, to_ts),
+        lambda: blockchain.contract.functions.getChatMessagesInRange(chat_id, from_ts, to_ts).call()
+    )
+
+async def flush_messages(messages: List[MessageModel]) -> dict:
+    """Send one sender's queued messages, as a single sendMessages call when there are several"""
+    first = messages[0]
+    if len(messages) == 1:
+        function = blockchain.contract.functions.sendMessage(
+            first.from_address, first.to_address, first.content, bool(first.is_media)
         )
+        return {**await send_transaction(function, first.private_key), "batch_size": 1}
+
+    function = blockchain.contract.functions.sendMessages(
+        first.from_address,
+        [message.to_address for message in messages],
+        [message.content for message in messages],
+        [bool(message.is_media) for message in messages]
+    )
+    signer = get_account_from_private_key(first.private_key).address
+    gas_limit = await batch_gas_limit(function, signer)
+    return {**await send_transaction(function, first.private_key, gas_limit), "batch_size": len(messages)}
+
+async def fetch_read_cursors(chat_id: bytes, user1_address: str, user2_address: str) -> Dict[str, int]:
+    """Each participant's read cursor in a chat (how many messages they have read)"""
+    cursor_calls = await batch_call(
+        blockchain.w3,
+        blockchain.contract.functions.getReadCursor(chat_id, Web3.to_checksum_address(user1_address)),
+        blockchain.contract.functions.getReadCursor(chat_id, Web3.to_checksum_address(user2_address))
+    )
+    return {
+        user1_address.lower(): cursor_calls[0].result(),
+        user2_address.lower(): cursor_calls[1].result()
+    }
 
-def get_account_from_private_key(private_key: str):
-    """Get account from private key"""
-    try:
-        if not private_key.startswith('0x'):
-            private_key = '0x' + private_key
-        account = w3.eth.account.from_key(private_key)
-        return account
-    except Exception as e:
+def apply_read_cursors(messages: List[dict], cursors: Dict[str, int]):
+    """Mark messages below the other participant's read cursor as read"""
+    for message in messages:
+        sender = message["sender"].lower()
+        if any(message["index"] < cursor for reader, cursor in cursors.items() if reader != sender):
+            message["is_read"] = True
+
+def check_addresses(addresses: List[str]):
+    """Reject malformed addresses with 400 before they reach a contract call"""
+    invalid = [address for address in addresses if not Web3.is_address(address)]
+    if invalid:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid private key: {str(e)}"
+            detail=f"Invalid addresses: {', '.join(invalid)}"
         )
 
-def send_transaction(function, private_key: str, gas_limit: int = 500000):
-    """Send a transaction to the blockchain"""
-    account = get_account_from_private_key(private_key)
-    
-    try:
-        # Build transaction
-        nonce = w3.eth.get_transaction_count(account.address)
-        transaction = function.build_transaction({
-            'from': account.address,
-            'nonce': nonce,
-            'gas': gas_limit,
-            'gasPrice': w3.eth.gas_price,
-        })
-        
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        
-        # Send transaction
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        
-        # Wait for receipt
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return {
-            'transaction_hash': tx_hash.hex(),
-            'block_number': tx_receipt['blockNumber'],
-            'gas_used': tx_receipt['gasUsed'],
-            'status': 'success' if tx_receipt['status'] == 1 else 'failed'
-        }
-    except Exception as e:
+def check_contract_initialized():
+    """Check if contract is initialized"""
+    if blockchain.contract is None:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Transaction failed: {str(e)}"
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Contract not initialized. Please set CONTRACT_ADDRESS"
         )
 
 
@@ -145,17 +156,20 @@ def send_transaction(function, private_key: str, gas_limit: int = 500000):
 
 @app.get("/health")
 async def health_check():
-    """Check if the API and Web3 connection are working"""
+    """Check if the API and Web3 connection are working (served from cached probe state)"""
+    snapshot = readiness()
     return {
         "status": "healthy",
-        "web3_connected": w3.is_connected(),
-        "contract_initialized": contract is not None,
+        "web3_connected": snapshot["rpc_reachable"],
+        "contract_initialized": blockchain.contract is not None,
         "network": "Ganache Local",
-        "contract_address": CONTRACT_ADDRESS if CONTRACT_ADDRESS else "Not set"
+        "contract_address": CONTRACT_ADDRESS if CONTRACT_ADDRESS else "Not set",
+        "latest_block": snapshot["latest_block"],
+        "rpc_endpoints": snapshot["rpc_endpoints"]
     }
 
 
-@app.post("/users/register", status_code=status.HTTP_201_CREATED)
+@app.post("/users/register", status_code=status.HTTP_201_CREATED, dependencies=[Depends(limit_writes)])
 async def register_user(user_data: UserRegistration):
     """Register a new user on the blockchain"""
     check_contract_initialized()
@@ -169,7 +183,7 @@ async def register_user(user_data: UserRegistration):
     
     try:
         # Check if user already exists
-        user_exists = contract.functions.checkUserExists(user_data.address).call()
+        user_exists = await blockchain.contract.functions.checkUserExists(user_data.address).call()
         if user_exists:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -177,8 +191,8 @@ async def register_user(user_data: UserRegistration):
             )
         
         # Register user
-        function = contract.functions.userRegistration(user_data.address, user_data.name)
-        tx_result = send_transaction(function, user_data.private_key)
+        function = blockchain.contract.functions.userRegistration(user_data.address, user_data.name)
+        tx_result = await send_transaction(function, user_data.private_key)
         
         return {
             "message": "User registered successfully",
@@ -195,22 +209,30 @@ async def register_user(user_data: UserRegistration):
         )
 
 
-@app.get("/users/{address}", response_model=UserResponse)
+@app.get("/users/{address}", response_model=UserResponse, dependencies=[Depends(limit_reads)])
 async def get_user(address: str):
     """Get user details by address"""
     check_contract_initialized()
     
     try:
-        # Check if user exists
-        user_exists = contract.functions.checkUserExists(address).call()
-        if not user_exists:
+        # Check existence and fetch details in a single batched round trip,
+        # shared with concurrent lookups of the same address
+        exists_call, user_call = await reads.do(
+            "getUser", address.lower(),
+            lambda: batch_call(
+                blockchain.w3,
+                blockchain.contract.functions.checkUserExists(address),
+                blockchain.contract.functions.getUser(address)
+            )
+        )
+        if not exists_call.result():
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"User {address} not found"
             )
         
         # Get user details
-        user_data = contract.functions.getUser(address).call()
+        user_data = user_call.result()
         
         return UserResponse(
             name=user_data[0],
@@ -228,17 +250,68 @@ async def get_user(address: str):
         )
 
 
-@app.get("/users/{address}/exists")
+@app.post("/users/batch", dependencies=[Depends(limit_reads)])
+async def get_users_batch(request: BatchUserRequest):
+    """Get details for many users in one round trip, unregistered users map to null"""
+    check_contract_initialized()
+    
+    # Preserve request order while dropping duplicates
+    addresses = list(dict.fromkeys(request.addresses))
+    if len(addresses) > MAX_BATCH_ADDRESSES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_ADDRESSES} addresses can be requested at once"
+        )
+    check_addresses(addresses)
+    
+    try:
+        # getUser reverts for unregistered users, so it doubles as the existence check
+        user_calls = await batch_call(
+            blockchain.w3,
+            *[blockchain.contract.functions.getUser(Web3.to_checksum_address(address)) for address in addresses]
+        )
+        
+        users = {}
+        for address, user_call in zip(addresses, user_calls):
+            if isinstance(user_call.error, ContractLogicError):
+                users[address] = None
+                continue
+            user_data = user_call.result()
+            users[address] = UserResponse(
+                name=user_data[0],
+                status=user_data[1],
+                profile_picture=user_data[2],
+                user_address=user_data[3],
+                status_expiry=user_data[4]
+            )
+        
+        return {
+            "requested": len(addresses),
+            "found": sum(1 for user in users.values() if user is not None),
+            "users": users
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get users: {str(e)}"
+        )
+
+
+@app.get("/users/{address}/exists", dependencies=[Depends(limit_reads)])
 async def check_user_exists(address: str):
     """Check if a user exists"""
     check_contract_initialized()
     
     try:
-        exists = contract.functions.checkUserExists(address).call()
+        exists = await blockchain.contract.functions.checkUserExists(address).call()
         return {
             "address": address,
             "exists": exists
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -246,15 +319,20 @@ async def check_user_exists(address: str):
         )
 
 
-@app.post("/messages/send", status_code=status.HTTP_201_CREATED)
+@app.post("/messages/send", status_code=status.HTTP_201_CREATED, dependencies=[Depends(limit_writes)])
 async def send_message_endpoint(message: MessageModel):
     """Send a message from one user to another"""
     check_contract_initialized()
     
     try:
-        # Check if both users exist
-        sender_exists = contract.functions.checkUserExists(message.from_address).call()
-        receiver_exists = contract.functions.checkUserExists(message.to_address).call()
+        # Check if both users exist (one batched round trip)
+        sender_call, receiver_call = await batch_call(
+            blockchain.w3,
+            blockchain.contract.functions.checkUserExists(message.from_address),
+            blockchain.contract.functions.checkUserExists(message.to_address)
+        )
+        sender_exists = sender_call.result()
+        receiver_exists = receiver_call.result()
         
         if not sender_exists:
             raise HTTPException(
@@ -268,14 +346,31 @@ async def send_message_endpoint(message: MessageModel):
                 detail=f"Receiver {message.to_address} is not registered"
             )
         
-        # Send message
-        function = contract.functions.sendMessage(
-            message.from_address,
-            message.to_address,
-            message.content,
-            message.is_media
-        )
-        tx_result = send_transaction(function, message.private_key)
+        # Send message (only its hash in hash storage mode, only a log in events mode)
+        content_hash = None
+        if events_mode():
+            function = blockchain.contract.functions.logMessage(
+                message.from_address,
+                message.to_address,
+                message.content,
+                message.is_media
+            )
+            tx_result = await send_transaction(function, message.private_key)
+        elif blobstore.hash_mode():
+            content_hash = await blobstore.store_content(message.content)
+            function = blockchain.contract.functions.sendMessageHash(
+                message.from_address,
+                message.to_address,
+                content_hash,
+                message.is_media
+            )
+            tx_result = await send_transaction(function, message.private_key)
+        else:
+            # Queued per sender: messages sent while a transaction is in flight share the next one
+            signer = get_account_from_private_key(message.private_key).address
+            tx_result = await sends.submit(
+                ("chat", signer, message.from_address.lower()), message, flush_messages
+            )
         
         # Calculate chat ID for reference
         chat_id = calculate_chat_id(message.from_address, message.to_address)
@@ -286,6 +381,7 @@ async def send_message_endpoint(message: MessageModel):
             "from": message.from_address,
             "to": message.to_address,
             "is_media": message.is_media,
+            "content_hash": "0x" + content_hash.hex() if content_hash else None,
             **tx_result
         }
     except HTTPException:
@@ -297,38 +393,39 @@ async def send_message_endpoint(message: MessageModel):
         )
 
 
-@app.post("/messages/chat")
+@app.post("/messages/chat", dependencies=[Depends(limit_reads)])
 async def get_chat_messages(request: ChatMessagesRequest):
     """Get all messages between two users"""
     check_contract_initialized()
+    check_addresses([request.user1_address, request.user2_address])
     
     try:
         # Calculate chat ID
         chat_id = calculate_chat_id(request.user1_address, request.user2_address)
         
         # Get messages
-        messages = contract.functions.getChatMessages(chat_id).call()
-        
-        # Format messages
-        formatted_messages = []
-        for idx, msg in enumerate(messages):
-            formatted_messages.append({
-                "index": idx,
-                "sender": msg[0],
-                "content": msg[1],
-                "timestamp": msg[2],
-                "is_read": msg[3],
-                "is_deleted": msg[4],
-                "is_media": msg[5]
-            })
+        if events_mode():
+            formatted_messages = await logged_messages(chat_id, request.from_ts, request.to_ts)
+        else:
+            # Read cursors are fetched alongside the messages
+            (start_index, messages), read_cursors = await asyncio.gather(
+                fetch_chat_messages(chat_id, request.from_ts, request.to_ts),
+                fetch_read_cursors(chat_id, request.user1_address, request.user2_address)
+            )
+            formatted_messages = await blobstore.format_messages(chat_id, start_index, messages)
+            apply_read_cursors(formatted_messages, read_cursors)
         
         return {
             "chat_id": chat_id.hex(),
             "user1": request.user1_address,
             "user2": request.user2_address,
+            "from_ts": request.from_ts,
+            "to_ts": request.to_ts,
             "message_count": len(formatted_messages),
             "messages": formatted_messages
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -336,7 +433,7 @@ async def get_chat_messages(request: ChatMessagesRequest):
         )
 
 
-@app.post("/messages/read")
+@app.post("/messages/read", dependencies=[Depends(limit_writes)])
 async def read_message_endpoint(request: ReadMessageModel):
     """Mark a message as read"""
     check_contract_initialized()
@@ -346,8 +443,8 @@ async def read_message_endpoint(request: ReadMessageModel):
         chat_id = calculate_chat_id(request.user1_address, request.user2_address)
         
         # Mark message as read
-        function = contract.functions.readMessage(chat_id, request.message_index)
-        tx_result = send_transaction(function, request.reader_private_key)
+        function = blockchain.contract.functions.readMessage(chat_id, request.message_index)
+        tx_result = await send_transaction(function, request.reader_private_key)
         
         return {
             "message": "Message marked as read",
@@ -355,6 +452,8 @@ async def read_message_endpoint(request: ReadMessageModel):
             "message_index": request.message_index,
             **tx_result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -362,7 +461,36 @@ async def read_message_endpoint(request: ReadMessageModel):
         )
 
 
-@app.delete("/messages/delete")
+@app.post("/messages/read-up-to", dependencies=[Depends(limit_writes)])
+async def read_messages_up_to_endpoint(request: ReadMessageModel):
+    """Mark every message up to message_index as read in one transaction"""
+    check_contract_initialized()
+    check_addresses([request.user1_address, request.user2_address])
+    
+    try:
+        # Calculate chat ID
+        chat_id = calculate_chat_id(request.user1_address, request.user2_address)
+        
+        # Move the reader's cursor past message_index
+        function = blockchain.contract.functions.readMessagesUpTo(chat_id, request.message_index)
+        tx_result = await send_transaction(function, request.reader_private_key)
+        
+        return {
+            "message": "Messages marked as read",
+            "chat_id": chat_id.hex(),
+            "read_up_to": request.message_index,
+            **tx_result
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to mark messages as read: {str(e)}"
+        )
+
+
+@app.delete("/messages/delete", dependencies=[Depends(limit_writes)])
 async def delete_message_endpoint(request: DeleteMessageModel):
     """Delete a message from chat"""
     check_contract_initialized()
@@ -375,12 +503,12 @@ async def delete_message_endpoint(request: DeleteMessageModel):
         deleter_account = get_account_from_private_key(request.deleter_private_key)
         
         # Delete message
-        function = contract.functions.deleteMessage(
+        function = blockchain.contract.functions.deleteMessage(
             chat_id,
             request.message_index,
             deleter_account.address
         )
-        tx_result = send_transaction(function, request.deleter_private_key)
+        tx_result = await send_transaction(function, request.deleter_private_key)
         
         return {
             "message": "Message deleted successfully",
@@ -388,6 +516,8 @@ async def delete_message_endpoint(request: DeleteMessageModel):
             "message_index": request.message_index,
             **tx_result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -0,0 +1,112 @@
+"""
+Content-addressed message store for MESSAGE_STORAGE_MODE=hash.
+
+Message bodies are kept in a local SQLite file keyed by their keccak256 hash and
+only the 32-byte hash is written on chain (sendMessageHash / sendGroupMessageHash).
+Read endpoints put the bodies back into the contract's messages and check every
+body against its on-chain hash before returning it.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+from typing import Dict, List
+
+from web3 import Web3
+import blockchain
+import timing
+try:
+    from config import MESSAGE_STORAGE_MODE, BLOB_DB_PATH
+except ImportError:
+    MESSAGE_STORAGE_MODE = os.getenv("MESSAGE_STORAGE_MODE", "onchain")
+    BLOB_DB_PATH = os.getenv("BLOB_DB_PATH", "blobs.db")
+
+
+def content_hash(content: str) -> bytes:
+    """keccak256 of the UTF-8 content, as computed for the on-chain hash"""
+    return bytes(Web3.keccak(text=content))
+
+
+class BlobStore:
+    """SQLite table of message bodies keyed by content hash"""
+
+    def __init__(self, path: str = BLOB_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("CREATE TABLE IF NOT EXISTS blobs (hash BLOB PRIMARY KEY, content TEXT NOT NULL) WITHOUT ROWID")
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def put(self, content: str) -> bytes:
+        """Store a body, returns its hash (storing the same body twice is a no-op)"""
+        digest = content_hash(content)
+        conn = self._connection()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO blobs (hash, content) VALUES (?, ?)", (digest, content))
+        return digest
+
+    def get_many(self, hashes: List[bytes]) -> Dict[bytes, str]:
+        """Bodies for the given hashes; missing or corrupted ones are left out"""
+        unique = list(dict.fromkeys(bytes(digest) for digest in hashes))
+        if not unique:
+            return {}
+        rows = self._connection().execute(
+            f"SELECT hash, content FROM blobs WHERE hash IN ({','.join('?' * len(unique))})", unique
+        ).fetchall()
+        # Never hand out a body that does not match the hash it is filed under
+        return {bytes(digest): content for digest, content in rows if content_hash(content) == bytes(digest)}
+
+
+blob_store = None
+_store_lock = threading.Lock()
+
+
+def get_blob_store() -> BlobStore:
+    global blob_store
+    if blob_store is None:
+        with _store_lock:
+            if blob_store is None:
+                blob_store = BlobStore()
+    return blob_store
+
+
+def hash_mode() -> bool:
+    return MESSAGE_STORAGE_MODE == "hash"
+
+
+async def store_content(content: str) -> bytes:
+    """Save a message body before its hash is sent on chain"""
+    return await asyncio.to_thread(get_blob_store().put, content)
+
+
+async def format_messages(chat_id: bytes, start_index: int, messages) -> List[dict]:
+    """Format a chat's or group's messages, filling in verified bodies of hash-only ones"""
+    formatted = [blockchain.format_message(idx, msg) for idx, msg in enumerate(messages, start=start_index)]
+    hashed = [
+        message for message, (_, _, flags, _) in zip(formatted, messages)
+        if flags & blockchain.MESSAGE_HASHED
+    ]
+    if not hashed:
+        return formatted
+
+    start = hashed[0]["index"]
+    end = hashed[-1]["index"] + 1
+    hashes = await blockchain.contract.functions.getMessageHashes(chat_id, start, end).call()
+    digests = [bytes(hashes[message["index"] - start]) for message in hashed]
+    with timing.span("blobs.lookup"):
+        bodies = await asyncio.to_thread(get_blob_store().get_many, digests)
+
+    for message, digest in zip(hashed, digests):
+        message["content_hash"] = "0x" + digest.hex()
+        # None when this instance does not hold the body
+        message["content"] = bodies.get(digest)
+    return formatted
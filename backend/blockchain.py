@@ -0,0 +1,245 @@
+"""
+Shared Web3 client - one connection pool and one contract instance for all routers
+"""
+from fastapi import HTTPException, status
+from eth_account import Account
+from web3 import AsyncWeb3
+from web3.exceptions import TimeExhausted
+from web3.middleware import async_geth_poa_middleware
+from rpcrouter import RPCRouter, DeadlineExceeded, rpc_affinity, remaining_time
+import aiohttp
+import asyncio
+import json
+import metrics
+import os
+import threading
+import time
+import timing
+try:
+    from config import (
+        BLOCKCHAIN_RPC_URLS,
+        CONTRACT_ADDRESS as CONFIG_CONTRACT_ADDRESS,
+        RPC_POOL_SIZE,
+        RPC_CONNECT_TIMEOUT,
+        RPC_READ_TIMEOUT,
+        RPC_EWMA_ALPHA,
+        RPC_MAX_FAILURES,
+        RPC_MAX_BLOCK_LAG,
+        RPC_PROBE_INTERVAL,
+        RPC_BREAKER_THRESHOLD,
+        RPC_BREAKER_COOLDOWN,
+    )
+except ImportError:
+    # Fallback for local development
+    BLOCKCHAIN_RPC_URLS = os.getenv("BLOCKCHAIN_RPC_URLS", os.getenv("BLOCKCHAIN_RPC_URL", "http://127.0.0.1:7545")).split(",")
+    CONFIG_CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS", "0xa2691703072E2821b9EE1698F05309289FA226c1")
+    RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "64"))
+    RPC_CONNECT_TIMEOUT = float(os.getenv("RPC_CONNECT_TIMEOUT", "3.05"))
+    RPC_READ_TIMEOUT = float(os.getenv("RPC_READ_TIMEOUT", "20"))
+    RPC_EWMA_ALPHA = float(os.getenv("RPC_EWMA_ALPHA", "0.3"))
+    RPC_MAX_FAILURES = int(os.getenv("RPC_MAX_FAILURES", "3"))
+    RPC_MAX_BLOCK_LAG = int(os.getenv("RPC_MAX_BLOCK_LAG", "5"))
+    RPC_PROBE_INTERVAL = float(os.getenv("RPC_PROBE_INTERVAL", "10"))
+    RPC_BREAKER_THRESHOLD = int(os.getenv("RPC_BREAKER_THRESHOLD", "5"))
+    RPC_BREAKER_COOLDOWN = float(os.getenv("RPC_BREAKER_COOLDOWN", "30"))
+
+
+def build_session(pool_size: int = RPC_POOL_SIZE) -> aiohttp.ClientSession:
+    """Keep-alive session whose pool can hold one connection per in-flight RPC"""
+    connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size)
+    timeout = aiohttp.ClientTimeout(sock_connect=RPC_CONNECT_TIMEOUT, sock_read=RPC_READ_TIMEOUT)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+def load_contract_abi():
+    """Load the contract ABI, preferring the ABI-only module from scripts/export_abi.py"""
+    try:
+        from contract_abi import ABI
+        return ABI
+    except ImportError:
+        pass
+
+    # Fall back to the full Brownie artifact (bytecode, AST, source maps)
+    contract_path = os.path.join(os.path.dirname(__file__), 'build', 'contracts', 'Whatsapp.json')
+    if not os.path.exists(contract_path):
+        # Try parent directory for local development
+        contract_path = os.path.join(os.path.dirname(__file__), '..', 'build', 'contracts', 'Whatsapp.json')
+
+    with open(contract_path, 'r') as f:
+        return json.load(f)['abi']
+
+
+# Contract address from config
+CONTRACT_ADDRESS = CONFIG_CONTRACT_ADDRESS
+
+# Client objects, built on first use (see __getattr__) rather than at import so
+# a cold start only pays for them once something actually needs the chain
+_CLIENT_ATTRIBUTES = ("rpc_router", "w3", "contract_abi", "contract")
+_client_lock = threading.Lock()
+
+
+def _build_client():
+    global rpc_router, w3, contract_abi, contract
+    if "w3" in globals():
+        return
+    with _client_lock:
+        if "w3" in globals():
+            return
+
+        # Routed over every configured endpoint, each one batch-capable so view
+        # calls can share one POST
+        router = RPCRouter(
+            BLOCKCHAIN_RPC_URLS,
+            session_factory=build_session,
+            ewma_alpha=RPC_EWMA_ALPHA,
+            max_failures=RPC_MAX_FAILURES,
+            max_block_lag=RPC_MAX_BLOCK_LAG,
+            probe_interval=RPC_PROBE_INTERVAL,
+            breaker_threshold=RPC_BREAKER_THRESHOLD,
+            breaker_cooldown=RPC_BREAKER_COOLDOWN
+        )
+        client = AsyncWeb3(router)
+        client.middleware_onion.inject(async_geth_poa_middleware, layer=0)
+
+        abi = load_contract_abi()
+        metrics.register_contract_abi(abi)
+
+        # Contract instance is only created when an address is provided
+        instance = None
+        if CONTRACT_ADDRESS and CONTRACT_ADDRESS != "":
+            instance = client.eth.contract(address=CONTRACT_ADDRESS, abi=abi)
+        rpc_router, contract_abi, contract = router, abi, instance
+        # Assigned last: its presence marks the client as built
+        w3 = client
+
+
+def get_w3() -> AsyncWeb3:
+    _build_client()
+    return w3
+
+
+def __getattr__(name: str):
+    """Build the shared client the first time blockchain.w3 / .contract / ... is read"""
+    if name in _CLIENT_ATTRIBUTES:
+        _build_client()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# ==================== Messages ====================
+
+# Bits of Message.flags, mirrored from Whatsapp.sol
+MESSAGE_READ = 1
+MESSAGE_DELETED = 2
+MESSAGE_MEDIA = 4
+MESSAGE_HASHED = 8
+
+
+def chat_id_for(user1_address: str, user2_address: str) -> bytes:
+    """Chat ID of two users as the contract computes it: both addresses in ascending order, packed and hashed"""
+    low, high = sorted(address.lower().replace('0x', '') for address in (user1_address, user2_address))
+    return AsyncWeb3.keccak(hexstr=low + high)
+
+
+def format_message(index: int, msg) -> dict:
+    """API representation of a Message(sender, timestamp, flags, content) tuple"""
+    sender, timestamp, flags, content = msg
+    return {
+        "index": index,
+        "sender": sender,
+        "content": content,
+        "timestamp": timestamp,
+        "is_read": bool(flags & MESSAGE_READ),
+        "is_deleted": bool(flags & MESSAGE_DELETED),
+        "is_media": bool(flags & MESSAGE_MEDIA)
+    }
+
+
+# ==================== Transactions ====================
+
+def get_account_from_private_key(private_key: str):
+    """Get account from private key"""
+    try:
+        if not private_key.startswith('0x'):
+            private_key = '0x' + private_key
+        account = Account.from_key(private_key)
+        return account
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid private key: {str(e)}"
+        )
+
+async def send_transaction(function, private_key: str, gas_limit: int = 500000):
+    """Send a transaction to the blockchain"""
+    account = get_account_from_private_key(private_key)
+    client = get_w3()
+    started = time.perf_counter()
+
+    # Keep every step of this transaction on the same RPC endpoint
+    affinity_token = rpc_affinity.set(account.address)
+    try:
+        # Build transaction (nonce and gas price are independent, fetch them together)
+        nonce, gas_price = await asyncio.gather(
+            timing.timed("tx.nonce", client.eth.get_transaction_count(account.address)),
+            timing.timed("tx.gas_price", client.eth.gas_price)
+        )
+        with timing.span("tx.build"):
+            transaction = await function.build_transaction({
+                'from': account.address,
+                'nonce': nonce,
+                'gas': gas_limit,
+                'gasPrice': gas_price,
+            })
+
+        # Sign transaction
+        with timing.span("tx.sign"):
+            signed_txn = Account.sign_transaction(transaction, private_key)
+
+        # Send transaction
+        with timing.span("tx.broadcast"):
+            tx_hash = await client.eth.send_raw_transaction(signed_txn.rawTransaction)
+
+        # Wait for receipt
+        metrics.PENDING_TRANSACTIONS.inc()
+        broadcast_at = time.perf_counter()
+        try:
+            with timing.span("tx.receipt"):
+                # Bounded by the request deadline rather than web3's 120s default
+                remaining = remaining_time()
+                tx_receipt = await client.eth.wait_for_transaction_receipt(
+                    tx_hash, timeout=max(remaining, 0) if remaining is not None else 120
+                )
+        except (DeadlineExceeded, TimeExhausted):
+            raise DeadlineExceeded(
+                f"Transaction {tx_hash.hex()} was broadcast but not mined before the request deadline"
+            )
+        finally:
+            metrics.PENDING_TRANSACTIONS.dec()
+        metrics.RECEIPT_WAIT.observe(time.perf_counter() - broadcast_at, function=function.fn_name)
+        metrics.GAS_USED.observe(tx_receipt['gasUsed'], function=function.fn_name)
+
+        return {
+            'transaction_hash': tx_hash.hex(),
+            'block_number': tx_receipt['blockNumber'],
+            'gas_used': tx_receipt['gasUsed'],
+            'status': 'success' if tx_receipt['status'] == 1 else 'failed'
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Transaction failed: {str(e)}"
+        )
+    finally:
+        rpc_affinity.reset(affinity_token)
+        metrics.CONTRACT_FUNCTION_DURATION.observe(
+            time.perf_counter() - started, function=function.fn_name, type="transaction"
+        )
+
+
+async def close():
+    """Release the RPC connection pools, called on application shutdown"""
+    if "rpc_router" in globals():
+        await rpc_router.close()
@@ -1,41 +1,18 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from pydantic import BaseModel
 from typing import List, Optional
 from web3 import Web3
-from web3.middleware import geth_poa_middleware
-import json
-import os
-try:
-    from config import BLOCKCHAIN_RPC_URL, CONTRACT_ADDRESS as CONFIG_CONTRACT_ADDRESS
-except ImportError:
-    # Fallback for local development
-    BLOCKCHAIN_RPC_URL = os.getenv("BLOCKCHAIN_RPC_URL", "http://127.0.0.1:7545")
-    CONFIG_CONTRACT_ADDRESS = os.getenv("CONTRACT_ADDRESS", "0xa2691703072E2821b9EE1698F05309289FA226c1")
+from blockchain import get_account_from_private_key, send_transaction
+import blockchain
+from ratelimit import limit_reads, limit_writes
+from rpcbatch import batch_call
+from singleflight import reads
+from indexer import events_mode, logged_messages
+from sendqueue import sends, batch_gas_limit
+import blobstore
 
 app = APIRouter()
 
-# Initialize Web3 connection
-w3 = Web3(Web3.HTTPProvider(BLOCKCHAIN_RPC_URL))
-w3.middleware_onion.inject(geth_poa_middleware, layer=0)
-
-# Load contract ABI from build artifacts
-contract_path = os.path.join(os.path.dirname(__file__), 'build', 'contracts', 'Whatsapp.json')
-if not os.path.exists(contract_path):
-    # Try parent directory for local development
-    contract_path = os.path.join(os.path.dirname(__file__), '..', 'build', 'contracts', 'Whatsapp.json')
-
-with open(contract_path, 'r') as f:
-    contract_data = json.load(f)
-    contract_abi = contract_data['abi']
-
-# Contract address from config
-CONTRACT_ADDRESS = CONFIG_CONTRACT_ADDRESS
-
-# Initialize contract instance
-contract = None
-if CONTRACT_ADDRESS and CONTRACT_ADDRESS != "":
-    contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=contract_abi)
-
 
 # ==================== Pydantic Models ====================
 
@@ -58,6 +35,11 @@ class GroupMemberAction(BaseModel):
     member_address: str
     private_key: str
 
+class GroupReadUpTo(BaseModel):
+    group_id: str
+    message_index: int
+    reader_private_key: str
+
 class UserStatusUpdate(BaseModel):
     user_address: str
     status: str
@@ -76,27 +58,16 @@ class BlockUserRequest(BaseModel):
 
 # ==================== Helper Functions ====================
 
+MAX_UINT256 = 2 ** 256 - 1
+
 def check_contract_initialized():
     """Check if contract is initialized"""
-    if not contract:
+    if blockchain.contract is None:
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Contract not initialized. Please set CONTRACT_ADDRESS"
         )
 
-def get_account_from_private_key(private_key: str):
-    """Get account from private key"""
-    try:
-        if not private_key.startswith('0x'):
-            private_key = '0x' + private_key
-        account = w3.eth.account.from_key(private_key)
-        return account
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Invalid private key: {str(e)}"
-        )
-
 def convert_to_bytes32(group_id: str) -> bytes:
     """Convert group_id to bytes32 format"""
     try:
@@ -127,61 +98,55 @@ def convert_to_bytes32(group_id: str) -> bytes:
             detail=f"Invalid group_id: {str(e)}"
         )
 
-def send_transaction(function, private_key: str, gas_limit: int = 500000):
-    """Send a transaction to the blockchain"""
-    account = get_account_from_private_key(private_key)
-    
-    try:
-        nonce = w3.eth.get_transaction_count(account.address)
-        transaction = function.build_transaction({
-            'from': account.address,
-            'nonce': nonce,
-            'gas': gas_limit,
-            'gasPrice': w3.eth.gas_price,
-        })
-        
-        signed_txn = w3.eth.account.sign_transaction(transaction, private_key)
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.rawTransaction)
-        tx_receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        return {
-            'transaction_hash': tx_hash.hex(),
-            'block_number': tx_receipt['blockNumber'],
-            'gas_used': tx_receipt['gasUsed'],
-            'status': 'success' if tx_receipt['status'] == 1 else 'failed'
-        }
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Transaction failed: {str(e)}"
+async def flush_group_messages(messages: List[GroupMessage]) -> dict:
+    """Send one member's queued messages to a group, as a single sendGroupMessages call when there are several"""
+    first = messages[0]
+    group_id_bytes = convert_to_bytes32(first.group_id)
+    if len(messages) == 1:
+        function = blockchain.contract.functions.sendGroupMessage(
+            group_id_bytes, first.sender_address, first.content, bool(first.is_media)
         )
+        return {**await send_transaction(function, first.sender_private_key), "batch_size": 1}
+
+    function = blockchain.contract.functions.sendGroupMessages(
+        group_id_bytes,
+        first.sender_address,
+        [message.content for message in messages],
+        [bool(message.is_media) for message in messages]
+    )
+    signer = get_account_from_private_key(first.sender_private_key).address
+    gas_limit = await batch_gas_limit(function, signer)
+    return {**await send_transaction(function, first.sender_private_key, gas_limit), "batch_size": len(messages)}
 
 
 # ==================== Group API Endpoints ====================
 
-@app.post("/groups/create", status_code=status.HTTP_201_CREATED)
+@app.post("/groups/create", status_code=status.HTTP_201_CREATED, dependencies=[Depends(limit_writes)])
 async def create_group(group: GroupCreate):
     """Create a new group"""
     check_contract_initialized()
     
     try:
-        # Verify all members exist
-        for member in group.members:
-            exists = contract.functions.checkUserExists(member).call()
-            if not exists:
+        # Verify all members exist (one batched round trip)
+        exists_calls = await batch_call(
+            blockchain.w3,
+            *[blockchain.contract.functions.checkUserExists(member) for member in group.members]
+        )
+        for member, exists_call in zip(group.members, exists_calls):
+            if not exists_call.result():
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Member {member} is not registered"
                 )
         
         # Create group
-        function = contract.functions.createGroup(
+        function = blockchain.contract.functions.createGroup(
             group.group_name,
             group.members,
             group.description,
             group.admin_address
         )
-        tx_result = send_transaction(function, group.admin_private_key, gas_limit=1000000)
+        tx_result = await send_transaction(function, group.admin_private_key, gas_limit=1000000)
         
         return {
             "message": "Group created successfully",
@@ -199,13 +164,16 @@ async def create_group(group: GroupCreate):
         )
 
 
-@app.get("/groups/user/{user_address}")
+@app.get("/groups/user/{user_address}", dependencies=[Depends(limit_reads)])
 async def get_user_groups(user_address: str):
     """Get all groups a user belongs to"""
     check_contract_initialized()
     
     try:
-        groups = contract.functions.getUserGroups(user_address).call()
+        groups = await reads.do(
+            "getUserGroups", user_address.lower(),
+            lambda: blockchain.contract.functions.getUserGroups(user_address).call()
+        )
         
         formatted_groups = []
         for group in groups:
@@ -222,6 +190,8 @@ async def get_user_groups(user_address: str):
             "group_count": len(formatted_groups),
             "groups": formatted_groups
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -229,7 +199,37 @@ async def get_user_groups(user_address: str):
         )
 
 
-@app.post("/groups/messages/send", status_code=status.HTTP_201_CREATED)
+@app.get("/groups/user/{user_address}/read-state", dependencies=[Depends(limit_reads)])
+async def get_group_read_states(user_address: str):
+    """Read position and unread count in each of a user's groups"""
+    check_contract_initialized()
+    
+    try:
+        group_ids, read_cursors, unread_counts = await reads.do(
+            "getGroupReadStates", user_address.lower(),
+            lambda: blockchain.contract.functions.getGroupReadStates(user_address).call()
+        )
+        
+        read_states = [
+            {"group_id": group_id.hex(), "read_cursor": read_cursor, "unread_count": unread_count}
+            for group_id, read_cursor, unread_count in zip(group_ids, read_cursors, unread_counts)
+        ]
+        
+        return {
+            "user_address": user_address,
+            "total_unread": sum(unread_counts),
+            "groups": read_states
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to get group read state: {str(e)}"
+        )
+
+
+@app.post("/groups/messages/send", status_code=status.HTTP_201_CREATED, dependencies=[Depends(limit_writes)])
 async def send_group_message(message: GroupMessage):
     """Send a message to a group"""
     check_contract_initialized()
@@ -238,19 +238,37 @@ async def send_group_message(message: GroupMessage):
         # Convert group ID to bytes32 format
         group_id_bytes = convert_to_bytes32(message.group_id)
         
-        # Send group message
-        function = contract.functions.sendGroupMessage(
-            group_id_bytes,
-            message.sender_address,
-            message.content,
-            message.is_media
-        )
-        tx_result = send_transaction(function, message.sender_private_key)
+        # Send group message (only its hash in hash storage mode, only a log in events mode)
+        content_hash = None
+        if events_mode():
+            function = blockchain.contract.functions.logGroupMessage(
+                group_id_bytes,
+                message.sender_address,
+                message.content,
+                message.is_media
+            )
+            tx_result = await send_transaction(function, message.sender_private_key)
+        elif blobstore.hash_mode():
+            content_hash = await blobstore.store_content(message.content)
+            function = blockchain.contract.functions.sendGroupMessageHash(
+                group_id_bytes,
+                message.sender_address,
+                content_hash,
+                message.is_media
+            )
+            tx_result = await send_transaction(function, message.sender_private_key)
+        else:
+            # Queued per sender and group: messages sent while a transaction is in flight share the next one
+            signer = get_account_from_private_key(message.sender_private_key).address
+            tx_result = await sends.submit(
+                ("group", signer, group_id_bytes, message.sender_address.lower()), message, flush_group_messages
+            )
         
         return {
             "message": "Group message sent successfully",
             "group_id": message.group_id,
             "sender": message.sender_address,
+            "content_hash": "0x" + content_hash.hex() if content_hash else None,
             **tx_result
         }
     except HTTPException:
@@ -262,35 +280,70 @@ async def send_group_message(message: GroupMessage):
         )
 
 
-@app.get("/groups/{group_id}/messages")
-async def get_group_messages(group_id: str):
-    """Get all messages in a group"""
+@app.get("/groups/{group_id}/messages", dependencies=[Depends(limit_reads)])
+async def get_group_messages(
+    group_id: str,
+    from_ts: Optional[int] = Query(None, ge=0),
+    to_ts: Optional[int] = Query(None, ge=0),
+    reader_address: Optional[str] = None
+):
+    """Get messages in a group, optionally restricted to a time range and as seen by one member"""
     check_contract_initialized()
     
     try:
+        if from_ts is not None and to_ts is not None and from_ts > to_ts:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="from_ts must not be after to_ts"
+            )
+        
         # Convert group ID to bytes32 format
         group_id_bytes = convert_to_bytes32(group_id)
         
-        # Get messages
-        messages = contract.functions.getGroupMessages(group_id_bytes).call()
+        # Get messages (binary-search range view when a time filter is set)
+        # Members polling the same group at once share one in-flight eth_call
+        if events_mode():
+            formatted_messages = await logged_messages(group_id_bytes, from_ts, to_ts)
+        elif from_ts is None and to_ts is None:
+            messages = await reads.do(
+                "getGroupMessages", group_id_bytes,
+                lambda: blockchain.contract.functions.getGroupMessages(group_id_bytes).call()
+            )
+            formatted_messages = await blobstore.format_messages(group_id_bytes, 0, messages)
+        else:
+            range_from = from_ts if from_ts is not None else 0
+            range_to = to_ts if to_ts is not None else MAX_UINT256
+            start_index, messages = await reads.do(
+                "getGroupMessagesInRange", (group_id_bytes, range_from, range_to),
+                lambda: blockchain.contract.functions.getGroupMessagesInRange(group_id_bytes, range_from, range_to).call()
+            )
+            formatted_messages = await blobstore.format_messages(group_id_bytes, start_index, messages)
         
-        formatted_messages = []
-        for idx, msg in enumerate(messages):
-            formatted_messages.append({
-                "index": idx,
-                "sender": msg[0],
-                "content": msg[1],
-                "timestamp": msg[2],
-                "is_read": msg[3],
-                "is_deleted": msg[4],
-                "is_media": msg[5]
-            })
+        # Group reads are per member, so is_read is only meaningful for a given reader
+        read_cursor = None
+        if reader_address and not Web3.is_address(reader_address):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid reader_address: {reader_address}"
+            )
+        if reader_address and not events_mode():
+            read_cursor = await blockchain.contract.functions.getGroupReadCursor(
+                group_id_bytes, Web3.to_checksum_address(reader_address)
+            ).call()
+            for formatted in formatted_messages:
+                formatted["is_read"] = formatted["index"] < read_cursor
         
         return {
             "group_id": group_id,
+            "from_ts": from_ts,
+            "to_ts": to_ts,
+            "reader_address": reader_address,
+            "read_cursor": read_cursor,
             "message_count": len(formatted_messages),
             "messages": formatted_messages
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -298,7 +351,39 @@ async def get_group_messages(group_id: str):
         )
 
 
-@app.post("/groups/leave")
+@app.post("/groups/messages/read-up-to", dependencies=[Depends(limit_writes)])
+async def read_group_messages_up_to(request: GroupReadUpTo):
+    """Mark every group message up to message_index as read for one member, in one transaction"""
+    check_contract_initialized()
+    
+    try:
+        group_id_bytes = convert_to_bytes32(request.group_id)
+        
+        # The contract moves the cursor of the signing account
+        reader_account = get_account_from_private_key(request.reader_private_key)
+        function = blockchain.contract.functions.readGroupMessagesUpTo(
+            group_id_bytes,
+            request.message_index
+        )
+        tx_result = await send_transaction(function, request.reader_private_key)
+        
+        return {
+            "message": "Group messages marked as read",
+            "group_id": request.group_id,
+            "reader": reader_account.address,
+            "read_up_to": request.message_index,
+            **tx_result
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to mark group messages as read: {str(e)}"
+        )
+
+
+@app.post("/groups/leave", dependencies=[Depends(limit_writes)])
 async def leave_group(action: GroupMemberAction):
     """Leave a group"""
     check_contract_initialized()
@@ -306,11 +391,11 @@ async def leave_group(action: GroupMemberAction):
     try:
         group_id_bytes = convert_to_bytes32(action.group_id)
         
-        function = contract.functions.leaveGroup(
+        function = blockchain.contract.functions.leaveGroup(
             group_id_bytes,
             action.member_address
         )
-        tx_result = send_transaction(function, action.private_key)
+        tx_result = await send_transaction(function, action.private_key)
         
         return {
             "message": "Left group successfully",
@@ -318,6 +403,8 @@ async def leave_group(action: GroupMemberAction):
             "member": action.member_address,
             **tx_result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -327,18 +414,18 @@ async def leave_group(action: GroupMemberAction):
 
 # ==================== User Profile API Endpoints ====================
 
-@app.put("/users/status")
+@app.put("/users/status", dependencies=[Depends(limit_writes)])
 async def update_user_status(status_update: UserStatusUpdate):
     """Update user status"""
     check_contract_initialized()
     
     try:
-        function = contract.functions.userStatus(
+        function = blockchain.contract.functions.userStatus(
             status_update.user_address,
             status_update.status,
             status_update.duration_seconds
         )
-        tx_result = send_transaction(function, status_update.private_key)
+        tx_result = await send_transaction(function, status_update.private_key)
         
         return {
             "message": "Status updated successfully",
@@ -347,6 +434,8 @@ async def update_user_status(status_update: UserStatusUpdate):
             "duration": status_update.duration_seconds,
             **tx_result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -354,17 +443,17 @@ async def update_user_status(status_update: UserStatusUpdate):
         )
 
 
-@app.put("/users/profile-picture")
+@app.put("/users/profile-picture", dependencies=[Depends(limit_writes)])
 async def update_profile_picture(picture_update: ProfilePictureUpdate):
     """Update user profile picture"""
     check_contract_initialized()
     
     try:
-        function = contract.functions.updateProfilePicture(
+        function = blockchain.contract.functions.updateProfilePicture(
             picture_update.user_address,
             picture_update.profile_picture_url
         )
-        tx_result = send_transaction(function, picture_update.private_key)
+        tx_result = await send_transaction(function, picture_update.private_key)
         
         return {
             "message": "Profile picture updated successfully",
@@ -372,6 +461,8 @@ async def update_profile_picture(picture_update: ProfilePictureUpdate):
             "profile_picture": picture_update.profile_picture_url,
             **tx_result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -379,20 +470,22 @@ async def update_profile_picture(picture_update: ProfilePictureUpdate):
         )
 
 
-@app.post("/users/block")
+@app.post("/users/block", dependencies=[Depends(limit_writes)])
 async def block_user(request: BlockUserRequest):
     """Block a user"""
     check_contract_initialized()
     
     try:
-        function = contract.functions.blockUser(request.user_to_block)
-        tx_result = send_transaction(function, request.blocker_private_key)
+        function = blockchain.contract.functions.blockUser(request.user_to_block)
+        tx_result = await send_transaction(function, request.blocker_private_key)
         
         return {
             "message": f"User {request.user_to_block} blocked successfully",
             "blocked_user": request.user_to_block,
             **tx_result
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
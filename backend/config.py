@@ -9,6 +9,26 @@ BLOCKCHAIN_RPC_URL = os.getenv(
     "http://127.0.0.1:7545"  # Default to local Ganache
 )
 
+# Multiple RPC endpoints - comma-separated, reads go to the fastest healthy one
+# and the rest act as failover. Defaults to the single BLOCKCHAIN_RPC_URL.
+BLOCKCHAIN_RPC_URLS = [
+    url.strip() for url in os.getenv("BLOCKCHAIN_RPC_URLS", BLOCKCHAIN_RPC_URL).split(",") if url.strip()
+]
+RPC_EWMA_ALPHA = float(os.getenv("RPC_EWMA_ALPHA", "0.3"))
+RPC_MAX_FAILURES = int(os.getenv("RPC_MAX_FAILURES", "3"))
+RPC_MAX_BLOCK_LAG = int(os.getenv("RPC_MAX_BLOCK_LAG", "5"))
+RPC_PROBE_INTERVAL = float(os.getenv("RPC_PROBE_INTERVAL", "10"))
+
+# Circuit breaker - open after this many failed RPC calls in a row, then fail fast
+# with 503 for RPC_BREAKER_COOLDOWN seconds before letting a trial call through
+RPC_BREAKER_THRESHOLD = int(os.getenv("RPC_BREAKER_THRESHOLD", "5"))
+RPC_BREAKER_COOLDOWN = float(os.getenv("RPC_BREAKER_COOLDOWN", "30"))
+
+# Request deadline in seconds, shared by every RPC call a request makes. Clients
+# may ask for less (never more) with the X-Request-Timeout header.
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+MIN_REQUEST_TIMEOUT_SECONDS = float(os.getenv("MIN_REQUEST_TIMEOUT_SECONDS", "1"))
+
 # Contract address - MUST be set via environment variable in production
 CONTRACT_ADDRESS = os.getenv(
     "CONTRACT_ADDRESS",
@@ -26,3 +46,60 @@ PORT = int(os.getenv("PORT", "8080"))
 
 # Environment
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
+
+# Message storage - "onchain" stores message content in the contract, "hash" keeps
+# the body in a local content-addressed store (BLOB_DB_PATH) and only its keccak256
+# hash on chain, "events" only emits MessageSent logs and serves history from the
+# indexer database (needs SEARCH_INDEX_ENABLED)
+MESSAGE_STORAGE_MODE = os.getenv("MESSAGE_STORAGE_MODE", "onchain")
+BLOB_DB_PATH = os.getenv("BLOB_DB_PATH", "blobs.db")
+
+# Sends from one account are sent one transaction at a time; messages queued while a
+# transaction is in flight go out together in the next one, up to this many
+SEND_BATCH_MAX_SIZE = int(os.getenv("SEND_BATCH_MAX_SIZE", "50"))
+
+# Full-text message search index (SQLite FTS5)
+SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", "search_index.db")
+SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+INDEXER_POLL_SECONDS = float(os.getenv("INDEXER_POLL_SECONDS", "5"))
+INDEXER_START_BLOCK = int(os.getenv("INDEXER_START_BLOCK", "0"))
+INDEXER_BLOCK_CHUNK = int(os.getenv("INDEXER_BLOCK_CHUNK", "2000"))
+
+# JSON-RPC batching - largest batch sent in one POST (many providers cap this)
+RPC_BATCH_MAX_SIZE = int(os.getenv("RPC_BATCH_MAX_SIZE", "100"))
+
+# Largest number of addresses accepted by POST /users/batch
+MAX_BATCH_ADDRESSES = int(os.getenv("MAX_BATCH_ADDRESSES", "500"))
+
+# RPC HTTP connection pooling. Each uvicorn worker (WEB_CONCURRENCY) holds its own
+# pool, so the total connection budget is split evenly between workers.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+RPC_MAX_CONNECTIONS = int(os.getenv("RPC_MAX_CONNECTIONS", "64"))
+RPC_POOL_SIZE = int(os.getenv(
+    "RPC_POOL_SIZE",
+    str(max(4, RPC_MAX_CONNECTIONS // max(WEB_CONCURRENCY, 1)))
+))
+RPC_CONNECT_TIMEOUT = float(os.getenv("RPC_CONNECT_TIMEOUT", "3.05"))
+RPC_READ_TIMEOUT = float(os.getenv("RPC_READ_TIMEOUT", "20"))
+
+# Request timing - Server-Timing response header and slow request log threshold
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+
+# On-demand cProfile profiling - comma-separated allowlist of tokens accepted in the
+# X-Profile / X-Profile-Token headers. Empty disables profiling entirely.
+PROFILE_TOKENS = [token.strip() for token in os.getenv("PROFILE_TOKENS", "").split(",") if token.strip()]
+PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "20"))
+
+# Token-bucket rate limiting. Per-caller (IP and address) budgets are in requests per
+# minute with a burst allowance; the global budgets cap total RPC-backed traffic per
+# worker. RATE_LIMIT_STORE=sqlite shares the buckets between workers on one host.
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.db")
+RATE_LIMIT_READ_PER_MINUTE = float(os.getenv("RATE_LIMIT_READ_PER_MINUTE", "120"))
+RATE_LIMIT_READ_BURST = float(os.getenv("RATE_LIMIT_READ_BURST", "30"))
+RATE_LIMIT_WRITE_PER_MINUTE = float(os.getenv("RATE_LIMIT_WRITE_PER_MINUTE", "20"))
+RATE_LIMIT_WRITE_BURST = float(os.getenv("RATE_LIMIT_WRITE_BURST", "5"))
+RATE_LIMIT_GLOBAL_READ_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_READ_PER_SECOND", "200"))
+RATE_LIMIT_GLOBAL_WRITE_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_WRITE_PER_SECOND", "20"))
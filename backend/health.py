@@ -0,0 +1,77 @@
+"""
+Liveness and readiness probes.
+
+Neither probe talks to the node. Readiness is answered from the state the RPC
+router's background probe loop keeps up to date, so load balancer checks add no
+RPC traffic and cannot stall on a slow node. The first readiness check builds
+the client and starts that loop if no RPC call has done so yet.
+"""
+import os
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+import blockchain
+import metrics
+try:
+    from config import RPC_PROBE_INTERVAL
+except ImportError:
+    RPC_PROBE_INTERVAL = float(os.getenv("RPC_PROBE_INTERVAL", "10"))
+
+app = APIRouter()
+
+# Probe results older than this many probe intervals count as stale
+STALE_PROBE_INTERVALS = 3
+
+
+def readiness() -> dict:
+    """Cached readiness snapshot: RPC reachability, latest block, block lag and pending transactions"""
+    router = blockchain.rpc_router
+    router.start_probing()
+    endpoints = router.status()
+    healthy = [endpoint for endpoint in endpoints if endpoint["healthy"]]
+    probe_age = time.time() - router.last_probe_at if router.last_probe_at is not None else None
+
+    reasons = []
+    if blockchain.contract is None:
+        reasons.append("contract not configured")
+    if probe_age is None:
+        reasons.append("waiting for first RPC probe")
+    elif probe_age > STALE_PROBE_INTERVALS * RPC_PROBE_INTERVAL:
+        reasons.append("RPC probe results are stale")
+    if probe_age is not None and not healthy:
+        reasons.append("no healthy RPC endpoint")
+    # Only while rejecting calls, so an idle instance can still receive the half-open trial
+    if router.breaker.is_open():
+        reasons.append("RPC circuit breaker open")
+
+    return {
+        "status": "ready" if not reasons else "not_ready",
+        "reasons": reasons,
+        "rpc_reachable": bool(healthy),
+        "latest_block": router.head_block(),
+        "block_lag": min((endpoint["block_lag"] for endpoint in healthy), default=None),
+        "pending_transactions": int(metrics.PENDING_TRANSACTIONS.get()),
+        "circuit_breaker": router.breaker.status(),
+        "checked_at": int(router.last_probe_at) if router.last_probe_at is not None else None,
+        "probe_age_seconds": round(probe_age, 2) if probe_age is not None else None,
+        "rpc_endpoints": endpoints
+    }
+
+
+# ==================== Health API Endpoints ====================
+
+@app.get("/health/live")
+async def liveness():
+    """Process is up and serving requests (no dependency checks)"""
+    return {"status": "alive"}
+
+
+@app.get("/health/ready")
+async def ready():
+    """Ready to serve traffic; 503 until the node is reachable and up to date"""
+    snapshot = readiness()
+    return JSONResponse(
+        status_code=200 if snapshot["status"] == "ready" else 503,
+        content=snapshot
+    )
@@ -0,0 +1,431 @@
+"""
+Message indexer - mirrors decoded MessageSent events into a local SQLite
+database with an FTS5 full-text index over message content. Hash-only messages
+(MessageHashSent) are indexed when their body is in the local blob store, and
+MessageDeleted events flag the message they delete so search leaves it out.
+
+With MESSAGE_STORAGE_MODE=events messages are only logged on chain (logMessage /
+logGroupMessage) and this database is where chat and group history is read from.
+"""
+import asyncio
+import blobstore
+import blockchain
+import logging
+import metrics
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+try:
+    from config import (
+        MESSAGE_STORAGE_MODE,
+        SEARCH_DB_PATH,
+        SEARCH_INDEX_ENABLED,
+        INDEXER_POLL_SECONDS,
+        INDEXER_START_BLOCK,
+        INDEXER_BLOCK_CHUNK,
+    )
+except ImportError:
+    MESSAGE_STORAGE_MODE = os.getenv("MESSAGE_STORAGE_MODE", "onchain")
+    SEARCH_DB_PATH = os.getenv("SEARCH_DB_PATH", "search_index.db")
+    SEARCH_INDEX_ENABLED = os.getenv("SEARCH_INDEX_ENABLED", "true").lower() == "true"
+    INDEXER_POLL_SECONDS = float(os.getenv("INDEXER_POLL_SECONDS", "5"))
+    INDEXER_START_BLOCK = int(os.getenv("INDEXER_START_BLOCK", "0"))
+    INDEXER_BLOCK_CHUNK = int(os.getenv("INDEXER_BLOCK_CHUNK", "2000"))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    chat_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    receiver TEXT,
+    content TEXT NOT NULL,
+    is_media INTEGER NOT NULL DEFAULT 0,
+    timestamp INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    transaction_hash TEXT NOT NULL,
+    chain_chat_id TEXT NOT NULL,
+    message_index INTEGER,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    UNIQUE (block_number, log_index)
+);
+
+CREATE INDEX IF NOT EXISTS messages_by_chat ON messages (chat_id, block_number, log_index);
+CREATE INDEX IF NOT EXISTS messages_by_position ON messages (chain_chat_id, message_index);
+
+-- Length of each chat's and group's message array on chain, keyed by the ID the contract logs
+CREATE TABLE IF NOT EXISTS message_counts (
+    chain_chat_id TEXT PRIMARY KEY,
+    count INTEGER NOT NULL
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS chat_participants (
+    address TEXT NOT NULL,
+    chat_id TEXT NOT NULL,
+    PRIMARY KEY (address, chat_id)
+) WITHOUT ROWID;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content,
+    chat_id,
+    content='messages',
+    content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2'
+);
+
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content, chat_id) VALUES (new.id, new.content, new.chat_id);
+END;
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+
+def normalize_id(value) -> str:
+    """Normalize a bytes32 chat/group ID to lowercase hex without 0x"""
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value).hex()
+    return value.lower().replace('0x', '')
+
+
+def build_match_query(query: str) -> str:
+    """Turn free text into a safe FTS5 expression (every term must match)"""
+    terms = [term.replace('"', '""') for term in query.split()]
+    return " ".join(f'"{term}"' for term in terms if term)
+
+
+# ==================== Storage ====================
+
+class MessageIndex:
+    """SQLite-backed store of indexed messages and their FTS5 index"""
+
+    def __init__(self, path: str = SEARCH_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._write_lock:
+            conn = self._connection()
+            # Databases created before deletions were indexed do not know where each
+            # message sits in the contract's arrays, so they are indexed again from the chain
+            columns = [row['name'] for row in conn.execute("PRAGMA table_info(messages)")]
+            if columns and 'message_index' not in columns:
+                conn.executescript(
+                    "DROP TABLE messages; DROP TABLE IF EXISTS messages_fts; "
+                    "DROP TABLE IF EXISTS chat_participants; DELETE FROM sync_state WHERE key = 'last_block';"
+                )
+            conn.executescript(SCHEMA)
+            self._merge_directional_chats(conn)
+            conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; WAL lets readers run alongside the writer"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _merge_directional_chats(self, conn: sqlite3.Connection):
+        """Refile chat messages indexed under per-direction chat IDs under the canonical ID"""
+        if conn.execute("SELECT 1 FROM sync_state WHERE key = 'canonical_chat_ids'").fetchone():
+            return
+        updates = []
+        for row in conn.execute("SELECT id, chat_id, sender, receiver FROM messages WHERE kind = 'chat'"):
+            chat_id = normalize_id(blockchain.chat_id_for(row['sender'], row['receiver']))
+            if chat_id != row['chat_id']:
+                updates.append((chat_id, row['id']))
+        if updates:
+            conn.executemany("UPDATE messages SET chat_id = ? WHERE id = ?", updates)
+            conn.execute("DELETE FROM chat_participants")
+            conn.execute(
+                "INSERT OR IGNORE INTO chat_participants (address, chat_id) "
+                "SELECT sender, chat_id FROM messages WHERE kind = 'chat' "
+                "UNION SELECT receiver, chat_id FROM messages WHERE kind = 'chat'"
+            )
+            # messages_fts keeps its own copy of chat_id
+            conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO sync_state (key, value) VALUES ('canonical_chat_ids', 1)")
+
+    def get_last_block(self) -> Optional[int]:
+        row = self._connection().execute(
+            "SELECT value FROM sync_state WHERE key = 'last_block'"
+        ).fetchone()
+        return row['value'] if row else None
+
+    def add_messages(self, rows: List[Dict], last_block: int, deletions: List[Tuple[str, int]] = ()):
+        """Insert decoded messages, flag deleted ones and advance the sync cursor atomically
+
+        rows must be in chain order: messages stored on chain without an explicit
+        message_index get the next slot of their chat's array. Rows whose content is
+        None are not indexed but still take their slot.
+        """
+        with self._write_lock:
+            conn = self._connection()
+            with conn:
+                counts = {}
+                for row in rows:
+                    chain_chat_id = row['chain_chat_id']
+                    if chain_chat_id not in counts:
+                        found = conn.execute(
+                            "SELECT count FROM message_counts WHERE chain_chat_id = ?", (chain_chat_id,)
+                        ).fetchone()
+                        counts[chain_chat_id] = found['count'] if found else 0
+                    if row['message_index'] is not None:
+                        counts[chain_chat_id] = max(counts[chain_chat_id], row['message_index'] + 1)
+                    elif row['stored']:
+                        row = dict(row, message_index=counts[chain_chat_id])
+                        counts[chain_chat_id] += 1
+                    if row['content'] is None:
+                        continue
+                    cursor = conn.execute(
+                        "INSERT OR IGNORE INTO messages (chat_id, kind, sender, receiver, content, is_media, "
+                        "timestamp, block_number, log_index, transaction_hash, chain_chat_id, message_index) "
+                        "VALUES (:chat_id, :kind, :sender, :receiver, :content, :is_media, "
+                        ":timestamp, :block_number, :log_index, :transaction_hash, :chain_chat_id, :message_index)",
+                        row
+                    )
+                    if cursor.rowcount and row['kind'] == 'chat':
+                        conn.executemany(
+                            "INSERT OR IGNORE INTO chat_participants (address, chat_id) VALUES (?, ?)",
+                            [(row['sender'], row['chat_id']), (row['receiver'], row['chat_id'])]
+                        )
+                conn.executemany(
+                    "INSERT INTO message_counts (chain_chat_id, count) VALUES (?, ?) "
+                    "ON CONFLICT(chain_chat_id) DO UPDATE SET count = excluded.count",
+                    counts.items()
+                )
+                conn.executemany(
+                    "UPDATE messages SET deleted = 1 WHERE chain_chat_id = ? AND message_index = ?",
+                    deletions
+                )
+                conn.execute(
+                    "INSERT INTO sync_state (key, value) VALUES ('last_block', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (last_block,)
+                )
+
+    def conversation(self, chat_id: str, from_ts: Optional[int] = None, to_ts: Optional[int] = None) -> List[Dict]:
+        """A chat's or group's logged messages in chain order, with their position in the chat"""
+        rows = self._connection().execute(
+            "SELECT * FROM ("
+            "SELECT ROW_NUMBER() OVER (ORDER BY block_number, log_index) - 1 AS position, "
+            "sender, content, is_media, timestamp, block_number, transaction_hash "
+            "FROM messages WHERE chat_id = ?"
+            ") WHERE timestamp >= ? AND timestamp <= ? ORDER BY position",
+            (normalize_id(chat_id), from_ts if from_ts is not None else 0,
+             to_ts if to_ts is not None else 2 ** 63 - 1)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, query: str, address: str, group_ids: List[str],
+               limit: int = 20, offset: int = 0) -> List[Dict]:
+        """Ranked full-text search restricted to the address's chats and groups"""
+        match = build_match_query(query)
+        if not match:
+            return []
+
+        conn = self._connection()
+        chat_ids = [
+            row['chat_id'] for row in conn.execute(
+                "SELECT chat_id FROM chat_participants WHERE address = ?",
+                (address.lower(),)
+            )
+        ]
+        scope = [normalize_id(chat_id) for chat_id in chat_ids + group_ids]
+        if not scope:
+            return []
+
+        # Both the text terms and the chat scope are resolved inside FTS5, so the
+        # posting lists are intersected before any row is ranked or fetched
+        scope_filter = " OR ".join(f'"{chat_id}"' for chat_id in scope)
+        expression = f"content : ({match}) AND chat_id : ({scope_filter})"
+
+        rows = conn.execute(
+            "SELECT m.chat_id, m.kind, m.sender, m.receiver, m.content, m.timestamp, "
+            "m.block_number, m.transaction_hash, "
+            "snippet(messages_fts, 0, '[', ']', '...', 16) AS snippet, "
+            "bm25(messages_fts, 1.0, 0.0) AS score "
+            "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid "
+            "WHERE messages_fts MATCH ? AND NOT m.deleted "
+            "ORDER BY score LIMIT ? OFFSET ?",
+            (expression, limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+# ==================== Chain Sync ====================
+
+class MessageIndexer:
+    """Pulls MessageSent logs from the contract and feeds them into a MessageIndex"""
+
+    def __init__(self, w3, contract, index: MessageIndex,
+                 start_block: int = INDEXER_START_BLOCK,
+                 chunk_size: int = INDEXER_BLOCK_CHUNK):
+        self.w3 = w3
+        self.contract = contract
+        self.index = index
+        self.start_block = start_block
+        self.chunk_size = chunk_size
+        # ABIs exported before sendMessageHash existed have no MessageHashSent event
+        self.has_hash_events = hasattr(contract.events, 'MessageHashSent')
+        self.has_delete_events = hasattr(contract.events, 'MessageDeleted')
+
+    async def _decode_log(self, log, transactions: Dict, content: Optional[str]) -> Optional[Dict]:
+        """Resolve which call emitted the log so chats can be scoped to participants"""
+        chain_chat_id = normalize_id(log['args']['chatId'])
+        # MessageHashSent carries the message's index in the contract's array
+        message_index = log['args'].get('messageIndex')
+        if content is None:
+            # Body not held here: nothing to index, but the message still takes its slot
+            return {'chain_chat_id': chain_chat_id, 'message_index': message_index, 'stored': True, 'content': None}
+        tx_hash = log['transactionHash']
+        metrics.record_cache('indexer_transactions', tx_hash in transactions)
+        if tx_hash not in transactions:
+            tx = await self.w3.eth.get_transaction(tx_hash)
+            function, params = self.contract.decode_function_input(tx['input'])
+            transactions[tx_hash] = {'function': function, 'params': params, 'position': 0}
+        call = transactions[tx_hash]
+        function, params, position = call['function'], call['params'], call['position']
+        # Batch sends emit one log per message in call order
+        call['position'] += 1
+
+        is_media = params['isMedia']
+        if function.fn_name in ('sendMessage', 'sendMessageHash', 'logMessage'):
+            kind = 'chat'
+            receiver = params['_receiver'].lower()
+        elif function.fn_name == 'sendMessages':
+            kind = 'chat'
+            receiver = params['receivers'][position].lower()
+            is_media = params['isMedia'][position]
+        elif function.fn_name in ('sendGroupMessage', 'sendGroupMessageHash', 'logGroupMessage'):
+            kind = 'group'
+            receiver = None
+        elif function.fn_name == 'sendGroupMessages':
+            kind = 'group'
+            receiver = None
+            is_media = params['isMedia'][position]
+        else:
+            return None
+
+        sender = log['args']['sender'].lower()
+        # Contracts deployed before canonical chat IDs log one ID per direction
+        chat_id = blockchain.chat_id_for(sender, receiver) if kind == 'chat' else log['args']['chatId']
+        return {
+            'chat_id': normalize_id(chat_id),
+            'kind': kind,
+            'sender': sender,
+            'receiver': receiver,
+            'content': content,
+            'is_media': bool(is_media),
+            'timestamp': log['args']['timestamp'],
+            'block_number': log['blockNumber'],
+            'log_index': log['logIndex'],
+            'transaction_hash': tx_hash.hex(),
+            'chain_chat_id': chain_chat_id,
+            'message_index': message_index,
+            # log-only sends leave nothing in the contract's arrays
+            'stored': function.fn_name not in ('logMessage', 'logGroupMessage'),
+        }
+
+    async def sync_once(self) -> int:
+        """Index every new MessageSent log and deletion up to the latest block, returns rows added"""
+        latest = await self.w3.eth.block_number
+        last_block = await asyncio.to_thread(self.index.get_last_block)
+        from_block = self.start_block if last_block is None else last_block + 1
+
+        added = 0
+        while from_block <= latest:
+            to_block = min(from_block + self.chunk_size - 1, latest)
+            logs = await self.contract.events.MessageSent.get_logs(fromBlock=from_block, toBlock=to_block)
+            contents = [log['args']['content'] for log in logs]
+            if self.has_hash_events:
+                hash_logs = await self.contract.events.MessageHashSent.get_logs(fromBlock=from_block, toBlock=to_block)
+                # Bodies this instance does not hold cannot be indexed and are skipped
+                bodies = await asyncio.to_thread(
+                    blobstore.get_blob_store().get_many, [log['args']['contentHash'] for log in hash_logs]
+                ) if hash_logs else {}
+                logs = list(logs) + list(hash_logs)
+                contents += [bodies.get(bytes(log['args']['contentHash'])) for log in hash_logs]
+            deletions = []
+            if self.has_delete_events:
+                deleted_logs = await self.contract.events.MessageDeleted.get_logs(fromBlock=from_block, toBlock=to_block)
+                deletions = [(normalize_id(log['args']['chatId']), log['args']['messageIndex']) for log in deleted_logs]
+            transactions = {}
+            rows = []
+            # Chain order, so messages stored on chain are numbered like the contract's arrays
+            for log, content in sorted(zip(logs, contents), key=lambda pair: (pair[0]['blockNumber'], pair[0]['logIndex'])):
+                row = await self._decode_log(log, transactions, content)
+                if row:
+                    rows.append(row)
+            # SQLite is blocking, keep it off the event loop
+            await asyncio.to_thread(self.index.add_messages, rows, to_block, deletions)
+            added += sum(1 for row in rows if row['content'] is not None)
+            from_block = to_block + 1
+        return added
+
+    async def run_forever(self, poll_seconds: float = INDEXER_POLL_SECONDS):
+        """Background loop, started from the application lifespan"""
+        while True:
+            try:
+                await self.sync_once()
+            except Exception:
+                logger.exception("Message indexer sync failed")
+            await asyncio.sleep(poll_seconds)
+
+
+# ==================== Shared Index ====================
+
+# Opened on first use and kept up to date by the indexer task started in main.py
+message_index = None
+_index_lock = threading.Lock()
+
+
+def get_message_index() -> Optional[MessageIndex]:
+    global message_index
+    if SEARCH_INDEX_ENABLED and message_index is None:
+        with _index_lock:
+            if message_index is None:
+                message_index = MessageIndex()
+    return message_index
+
+
+def events_mode() -> bool:
+    return MESSAGE_STORAGE_MODE == "events"
+
+
+async def logged_messages(chat_id: bytes, from_ts: Optional[int], to_ts: Optional[int]) -> List[Dict]:
+    """Chat or group history rebuilt from indexed MessageSent logs, in the API message format"""
+    index = get_message_index()
+    if index is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Events storage mode reads history from the message index. Set SEARCH_INDEX_ENABLED=true"
+        )
+    rows = await asyncio.to_thread(index.conversation, chat_id, from_ts, to_ts)
+    return [
+        {
+            "index": row["position"],
+            "sender": row["sender"],
+            "content": row["content"],
+            "timestamp": row["timestamp"],
+            # Logged messages cannot be marked read or deleted on chain
+            "is_read": False,
+            "is_deleted": False,
+            "is_media": bool(row["is_media"]),
+            "block_number": row["block_number"],
+            "transaction_hash": row["transaction_hash"]
+        }
+        for row in rows
+    ]
@@ -1,13 +1,49 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from Registrations import app as registrations_router
 from chatservices import app as chatservices_router
+from search import app as search_router, run_indexer
+from health import app as health_router
+from rpcrouter import rpc_deadline
+import blockchain
+import asyncio
+import json
+import logging
+import metrics
 import os
+import profiling
+import time
+import timing
 
 try:
-    from config import ALLOWED_ORIGINS
+    from config import (
+        ALLOWED_ORIGINS,
+        SERVER_TIMING_ENABLED,
+        SLOW_REQUEST_MS,
+        REQUEST_TIMEOUT_SECONDS,
+        MIN_REQUEST_TIMEOUT_SECONDS,
+    )
 except ImportError:
     ALLOWED_ORIGINS = ["*"]
+    SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+    SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "2000"))
+    REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "60"))
+    MIN_REQUEST_TIMEOUT_SECONDS = float(os.getenv("MIN_REQUEST_TIMEOUT_SECONDS", "1"))
+
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background tasks on startup and stop them on shutdown"""
+    # The RPC client and its probe loop are left to the first request that needs them
+    tasks = [asyncio.create_task(run_indexer())]
+    yield
+    for task in tasks:
+        task.cancel()
+    await blockchain.close()
+
 
 # Create FastAPI application
 app = FastAPI(
@@ -15,7 +51,8 @@ app = FastAPI(
     description="Decentralized WhatsApp API built on Ethereum blockchain",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -27,7 +64,66 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def request_timeout(request: Request) -> float:
+    """Server deadline, shortened (never extended) by a valid X-Request-Timeout header"""
+    try:
+        requested = float(request.headers.get("x-request-timeout", REQUEST_TIMEOUT_SECONDS))
+    except ValueError:
+        return REQUEST_TIMEOUT_SECONDS
+    return min(max(requested, MIN_REQUEST_TIMEOUT_SECONDS), REQUEST_TIMEOUT_SECONDS)
+
+@app.middleware("http")
+async def apply_deadline(request: Request, call_next):
+    """Every RPC call made while handling the request shares one deadline"""
+    token = rpc_deadline.set(time.monotonic() + request_timeout(request))
+    try:
+        return await call_next(request)
+    finally:
+        rpc_deadline.reset(token)
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    """Record latency metrics, Server-Timing spans and the slow request log"""
+    start = time.perf_counter()
+    spans_token = timing.start_request()
+    status_code = 500
+    response = None
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        duration = time.perf_counter() - start
+        spans = timing.summarize(timing.finish_request(spans_token))
+        # Route template (not raw path) keeps label cardinality bounded
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUEST_DURATION.observe(
+            duration, method=request.method, route=route_path, status=status_code
+        )
+        if response is not None and SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = timing.server_timing_header(spans, duration * 1000)
+        if duration * 1000 >= SLOW_REQUEST_MS:
+            logger.warning("slow request %s", json.dumps({
+                "method": request.method,
+                "path": request.url.path,
+                "route": route_path,
+                "status": status_code,
+                "duration_ms": round(duration * 1000, 2),
+                "spans": spans
+            }))
+
+# Opt-in profiling: nothing is installed unless PROFILE_TOKENS is set
+if profiling.PROFILING_ENABLED:
+    app.middleware("http")(profiling.profile_request)
+
 # Include routers
+app.include_router(
+    health_router,
+    prefix="/api/v1",
+    tags=["Health"]
+)
+
 app.include_router(
     registrations_router,
     prefix="/api/v1",
@@ -40,6 +136,20 @@ app.include_router(
     tags=["Groups & Profile"]
 )
 
+app.include_router(
+    search_router,
+    prefix="/api/v1",
+    tags=["Search"]
+)
+
+if profiling.PROFILING_ENABLED:
+    app.include_router(
+        profiling.app,
+        prefix="/api/v1",
+        tags=["Admin"],
+        include_in_schema=False
+    )
+
 @app.get("/")
 async def root():
     """Root endpoint - API information"""
@@ -48,9 +158,17 @@ async def root():
         "version": "1.0.0",
         "description": "Decentralized messaging platform on Ethereum",
         "docs": "/docs",
-        "health": "/api/v1/health"
+        "health": "/api/v1/health",
+        "liveness": "/api/v1/health/live",
+        "readiness": "/api/v1/health/ready",
+        "metrics": "/metrics"
     }
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/v1/info")
 async def api_info():
     """Get API information and available endpoints"""
@@ -60,6 +178,7 @@ async def api_info():
             "user_management": {
                 "register": "POST /api/v1/users/register",
                 "get_user": "GET /api/v1/users/{address}",
+                "get_users_batch": "POST /api/v1/users/batch",
                 "check_exists": "GET /api/v1/users/{address}/exists",
                 "update_status": "PUT /api/v1/users/status",
                 "update_profile_picture": "PUT /api/v1/users/profile-picture",
@@ -69,14 +188,25 @@ async def api_info():
                 "send_message": "POST /api/v1/messages/send",
                 "get_chat": "POST /api/v1/messages/chat",
                 "read_message": "POST /api/v1/messages/read",
+                "read_messages_up_to": "POST /api/v1/messages/read-up-to",
                 "delete_message": "DELETE /api/v1/messages/delete"
             },
             "groups": {
                 "create_group": "POST /api/v1/groups/create",
                 "get_user_groups": "GET /api/v1/groups/user/{user_address}",
+                "get_group_read_state": "GET /api/v1/groups/user/{user_address}/read-state",
                 "send_group_message": "POST /api/v1/groups/messages/send",
                 "get_group_messages": "GET /api/v1/groups/{group_id}/messages",
+                "read_group_messages_up_to": "POST /api/v1/groups/messages/read-up-to",
                 "leave_group": "POST /api/v1/groups/leave"
+            },
+            "search": {
+                "search_messages": "GET /api/v1/search?q=...&address=..."
+            },
+            "monitoring": {
+                "liveness": "GET /api/v1/health/live",
+                "readiness": "GET /api/v1/health/ready",
+                "metrics": "GET /metrics"
             }
         },
         "documentation": "/docs"
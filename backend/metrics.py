@@ -0,0 +1,232 @@
+"""
+In-process metrics exported in the Prometheus text exposition format.
+
+Only counters, gauges and histograms are implemented - enough for /metrics to be
+scraped by Prometheus or read by Cloud Monitoring without any external service.
+"""
+import math
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from web3 import Web3
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+GAS_BUCKETS = (21000, 50000, 100000, 200000, 300000, 500000, 750000, 1000000, 2000000, 5000000)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Metric:
+    """Base class holding one value (or bucket set) per label combination"""
+
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], object] = {}
+        REGISTRY.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type_name = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, dict(state, counts=list(state["counts"]))) for key, state in self._values.items()]
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state["counts"]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, (("le", _format_value(bound)),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format"""
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
+
+
+# ==================== Application Metrics ====================
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "API request latency by route",
+    ("method", "route", "status")
+)
+RPC_REQUEST_DURATION = Histogram(
+    "rpc_request_duration_seconds", "JSON-RPC request latency by method and endpoint",
+    ("method", "endpoint")
+)
+RPC_ERRORS = Counter(
+    "rpc_errors_total", "JSON-RPC failures by method, endpoint and kind (transport, timeout, rpc or probe)",
+    ("method", "endpoint", "kind")
+)
+RPC_CIRCUIT_STATE = Gauge(
+    "rpc_circuit_state", "RPC circuit breaker state (0 closed, 1 half-open, 2 open)"
+)
+CONTRACT_FUNCTION_DURATION = Histogram(
+    "contract_function_duration_seconds", "Contract function latency (view calls and full transactions)",
+    ("function", "type")
+)
+PENDING_TRANSACTIONS = Gauge(
+    "pending_transactions", "Transactions broadcast and still waiting for a receipt"
+)
+RECEIPT_WAIT = Histogram(
+    "transaction_receipt_wait_seconds", "Time from broadcast until the receipt is available",
+    ("function",)
+)
+GAS_USED = Histogram(
+    "transaction_gas_used", "Gas used per transaction by contract function",
+    ("function",), buckets=GAS_BUCKETS
+)
+SEND_BATCH_SIZE = Histogram(
+    "send_batch_size", "Messages carried per send transaction by the per-sender send queue",
+    buckets=BATCH_BUCKETS
+)
+RATE_LIMITED = Counter(
+    "rate_limited_requests_total", "Requests rejected with 429 by kind (read or write)",
+    ("kind",)
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Cache lookups by cache name and result (hit or miss)",
+    ("cache", "result")
+)
+CACHE_HIT_RATIO = Gauge(
+    "cache_hit_ratio", "Fraction of cache lookups served from the cache",
+    ("cache",)
+)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+    hits = CACHE_REQUESTS.get(cache=cache, result="hit")
+    misses = CACHE_REQUESTS.get(cache=cache, result="miss")
+    CACHE_HIT_RATIO.set(hits / (hits + misses), cache=cache)
+
+
+# ==================== Contract Function Names ====================
+
+_selectors: Dict[str, str] = {}
+
+
+def register_contract_abi(abi: list):
+    """Map 4-byte selectors to function names so eth_calls can be labelled"""
+    for item in abi:
+        if item.get("type") != "function":
+            continue
+        signature = f"{item['name']}({','.join(_canonical_type(arg) for arg in item.get('inputs', []))})"
+        _selectors[Web3.keccak(text=signature)[:4].hex()] = item["name"]
+
+
+def _canonical_type(arg: dict) -> str:
+    if arg["type"].startswith("tuple"):
+        inner = ",".join(_canonical_type(component) for component in arg["components"])
+        return f"({inner}){arg['type'][len('tuple'):]}"
+    return arg["type"]
+
+
+def contract_function_name(method: str, params) -> Optional[str]:
+    """Contract function targeted by an eth_call, if it can be identified"""
+    if method != "eth_call" or not params:
+        return None
+    data = params[0].get("data") or params[0].get("input") or ""
+    selector = data[:10] if data.startswith("0x") else "0x" + data[:8]
+    return _selectors.get(selector)
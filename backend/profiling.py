@@ -0,0 +1,157 @@
+"""
+On-demand cProfile profiling.
+
+Disabled unless PROFILE_TOKENS is set; when disabled main.py installs neither the
+middleware nor the admin routes, so normal requests pay nothing.
+
+- Single request: send `X-Profile: <token>`; the stats id comes back in `X-Profile-Id`
+- Time window: `POST /api/v1/admin/profiles/window?seconds=N` profiles the whole
+  worker (every request it serves) for N seconds
+
+cProfile follows the thread, not the task, so a profile also contains whatever
+other requests the event loop ran meanwhile. Only one profile runs at a time.
+"""
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, status
+try:
+    from config import PROFILE_TOKENS, PROFILE_MAX_STORED
+except ImportError:
+    PROFILE_TOKENS = [token for token in os.getenv("PROFILE_TOKENS", "").split(",") if token]
+    PROFILE_MAX_STORED = int(os.getenv("PROFILE_MAX_STORED", "20"))
+
+PROFILING_ENABLED = bool(PROFILE_TOKENS)
+
+# Most recent profiles, oldest evicted first
+_profiles: "OrderedDict[str, dict]" = OrderedDict()
+_active = False
+
+
+def _allowed(token: Optional[str]) -> bool:
+    return token is not None and any(hmac.compare_digest(token, allowed) for allowed in PROFILE_TOKENS)
+
+
+def _store(profiler: cProfile.Profile, label: str, duration: float) -> str:
+    stats = pstats.Stats(profiler)
+    profile_id = uuid.uuid4().hex[:12]
+    _profiles[profile_id] = {
+        "id": profile_id,
+        "label": label,
+        "created_at": int(time.time()),
+        "duration_ms": round(duration * 1000, 2),
+        "total_calls": stats.total_calls,
+        "stats": stats,
+    }
+    while len(_profiles) > PROFILE_MAX_STORED:
+        _profiles.popitem(last=False)
+    return profile_id
+
+
+def _format(stats: pstats.Stats, sort: str, limit: int) -> str:
+    stream = io.StringIO()
+    stats.stream = stream
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def _start() -> cProfile.Profile:
+    global _active
+    if _active:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Another profile is already running"
+        )
+    _active = True
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _stop(profiler: cProfile.Profile):
+    global _active
+    profiler.disable()
+    _active = False
+
+
+# ==================== Request Profiling ====================
+
+async def profile_request(request: Request, call_next):
+    """Middleware: run the request under cProfile when X-Profile carries an allowed token"""
+    if not _allowed(request.headers.get("x-profile")) or _active:
+        return await call_next(request)
+
+    profiler = _start()
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        _stop(profiler)
+    profile_id = _store(profiler, f"{request.method} {request.url.path}", time.perf_counter() - start)
+    response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+# ==================== Admin API Endpoints ====================
+
+def require_profile_token(x_profile_token: Optional[str] = Header(None)):
+    if not _allowed(x_profile_token):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Missing or invalid X-Profile-Token"
+        )
+
+
+app = APIRouter(dependencies=[Depends(require_profile_token)])
+
+
+@app.get("/admin/profiles")
+async def list_profiles():
+    """List stored profiles, newest first"""
+    profiles = [
+        {key: value for key, value in profile.items() if key != "stats"}
+        for profile in reversed(_profiles.values())
+    ]
+    return {"count": len(profiles), "profiles": profiles}
+
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile(
+    profile_id: str,
+    sort: str = Query("cumulative", pattern="^(cumulative|tottime|calls|ncalls)$"),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Collated stats of one profile"""
+    profile = _profiles.get(profile_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {profile_id} not found"
+        )
+    return {
+        **{key: value for key, value in profile.items() if key != "stats"},
+        "sort": sort,
+        "report": _format(profile["stats"], sort, limit)
+    }
+
+
+@app.post("/admin/profiles/window")
+async def profile_window(seconds: float = Query(10, gt=0, le=300)):
+    """Profile everything this worker runs for the given number of seconds"""
+    profiler = _start()
+    start = time.perf_counter()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        _stop(profiler)
+    duration = time.perf_counter() - start
+    profile_id = _store(profiler, f"window {seconds:g}s", duration)
+    return {"id": profile_id, "duration_ms": round(duration * 1000, 2)}
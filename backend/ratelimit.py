@@ -0,0 +1,246 @@
+"""
+Token-bucket rate limiting for the API.
+
+Every request draws one token from three buckets: the caller's IP, the caller's
+address (when the request names one) and a global bucket that protects the RPC
+quota. Reads and writes have separate budgets. A request is only charged when
+all of its buckets have a token, otherwise it is rejected with 429.
+
+State lives in process memory by default. With RATE_LIMIT_STORE=sqlite the
+buckets are kept in a SQLite file (RATE_LIMIT_DB_PATH) so every worker on the
+host shares the same budget.
+"""
+import asyncio
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+import metrics
+try:
+    from config import (
+        RATE_LIMIT_ENABLED,
+        RATE_LIMIT_STORE,
+        RATE_LIMIT_DB_PATH,
+        RATE_LIMIT_READ_PER_MINUTE,
+        RATE_LIMIT_READ_BURST,
+        RATE_LIMIT_WRITE_PER_MINUTE,
+        RATE_LIMIT_WRITE_BURST,
+        RATE_LIMIT_GLOBAL_READ_PER_SECOND,
+        RATE_LIMIT_GLOBAL_WRITE_PER_SECOND,
+    )
+except ImportError:
+    RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_STORE = os.getenv("RATE_LIMIT_STORE", "memory")
+    RATE_LIMIT_DB_PATH = os.getenv("RATE_LIMIT_DB_PATH", "ratelimit.db")
+    RATE_LIMIT_READ_PER_MINUTE = float(os.getenv("RATE_LIMIT_READ_PER_MINUTE", "120"))
+    RATE_LIMIT_READ_BURST = float(os.getenv("RATE_LIMIT_READ_BURST", "30"))
+    RATE_LIMIT_WRITE_PER_MINUTE = float(os.getenv("RATE_LIMIT_WRITE_PER_MINUTE", "20"))
+    RATE_LIMIT_WRITE_BURST = float(os.getenv("RATE_LIMIT_WRITE_BURST", "5"))
+    RATE_LIMIT_GLOBAL_READ_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_READ_PER_SECOND", "200"))
+    RATE_LIMIT_GLOBAL_WRITE_PER_SECOND = float(os.getenv("RATE_LIMIT_GLOBAL_WRITE_PER_SECOND", "20"))
+
+# Request fields that name the calling address, in order of preference
+ADDRESS_FIELDS = (
+    "from_address", "sender_address", "admin_address", "user_address",
+    "address", "user1_address", "member_address", "reader_address",
+)
+
+
+class Bucket:
+    """Bucket definition: `capacity` tokens, refilled at `rate` tokens per second"""
+
+    def __init__(self, key: str, capacity: float, rate: float):
+        self.key = key
+        self.capacity = capacity
+        self.rate = rate
+
+
+def refill(tokens: float, updated_at: float, bucket: Bucket, now: float) -> float:
+    return min(bucket.capacity, tokens + (now - updated_at) * bucket.rate)
+
+
+def decide(buckets: List[Bucket], levels: Dict[str, float]) -> Tuple[bool, float, float]:
+    """Given refilled token levels, return (allowed, retry_after, remaining)"""
+    remaining = min(levels[bucket.key] for bucket in buckets)
+    if remaining >= 1:
+        return True, 0.0, remaining - 1
+    # Time until every exhausted bucket holds a whole token again
+    retry_after = max((1 - levels[bucket.key]) / bucket.rate for bucket in buckets if levels[bucket.key] < 1)
+    return False, retry_after, remaining
+
+
+# ==================== Storage ====================
+
+class MemoryBucketStore:
+    """Per-process buckets, least recently used keys evicted beyond max_keys"""
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, buckets: List[Bucket], now: float) -> Tuple[bool, float, float]:
+        with self._lock:
+            levels = {}
+            for bucket in buckets:
+                tokens, updated_at = self._buckets.get(bucket.key, (bucket.capacity, now))
+                levels[bucket.key] = refill(tokens, updated_at, bucket, now)
+            allowed, retry_after, remaining = decide(buckets, levels)
+            for bucket in buckets:
+                self._buckets[bucket.key] = (levels[bucket.key] - (1 if allowed else 0), now)
+                self._buckets.move_to_end(bucket.key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return allowed, retry_after, remaining
+
+
+class SQLiteBucketStore:
+    """Buckets shared by all workers on the host through one SQLite file"""
+
+    # Drop buckets idle for this long (they would be full again anyway)
+    EXPIRE_SECONDS = 3600
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        conn = self._connection()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, buckets: List[Bucket], now: float) -> Tuple[bool, float, float]:
+        conn = self._connection()
+        # IMMEDIATE takes the write lock up front so workers cannot interleave
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            keys = [bucket.key for bucket in buckets]
+            rows = dict(
+                (key, (tokens, updated_at)) for key, tokens, updated_at in conn.execute(
+                    f"SELECT key, tokens, updated_at FROM buckets WHERE key IN ({','.join('?' * len(keys))})", keys
+                )
+            )
+            levels = {}
+            for bucket in buckets:
+                tokens, updated_at = rows.get(bucket.key, (bucket.capacity, now))
+                levels[bucket.key] = refill(tokens, updated_at, bucket, now)
+            allowed, retry_after, remaining = decide(buckets, levels)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                [(bucket.key, levels[bucket.key] - (1 if allowed else 0), now) for bucket in buckets]
+            )
+            self._takes += 1
+            if self._takes % 1000 == 0:
+                conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self.EXPIRE_SECONDS,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return allowed, retry_after, remaining
+
+
+# ==================== Limiter ====================
+
+class RateLimiter:
+    """Builds the buckets for a request and asks the store for a token"""
+
+    def __init__(self, store, limits: Dict[str, Dict[str, float]]):
+        self.store = store
+        self.limits = limits
+
+    def buckets_for(self, kind: str, ip: Optional[str], address: Optional[str]) -> List[Bucket]:
+        limits = self.limits[kind]
+        per_key_rate = limits["per_minute"] / 60
+        buckets = [Bucket(f"global:{kind}", limits["global_per_second"], limits["global_per_second"])]
+        if ip:
+            buckets.append(Bucket(f"ip:{ip}:{kind}", limits["burst"], per_key_rate))
+        if address:
+            buckets.append(Bucket(f"address:{address.lower()}:{kind}", limits["burst"], per_key_rate))
+        return buckets
+
+    async def check(self, kind: str, ip: Optional[str], address: Optional[str]):
+        buckets = self.buckets_for(kind, ip, address)
+        now = time.time()
+        if isinstance(self.store, SQLiteBucketStore):
+            allowed, retry_after, remaining = await asyncio.to_thread(self.store.take, buckets, now)
+        else:
+            allowed, retry_after, remaining = self.store.take(buckets, now)
+
+        if not allowed:
+            metrics.RATE_LIMITED.inc(kind=kind)
+            reset = max(1, math.ceil(retry_after))
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=f"Rate limit exceeded for {kind} requests, retry in {reset}s",
+                headers={
+                    "Retry-After": str(reset),
+                    "X-RateLimit-Limit": str(int(self.limits[kind]["per_minute"])),
+                    "X-RateLimit-Remaining": "0",
+                    "X-RateLimit-Reset": str(int(time.time()) + reset),
+                }
+            )
+
+
+limiter = None
+if RATE_LIMIT_ENABLED:
+    limiter = RateLimiter(
+        SQLiteBucketStore() if RATE_LIMIT_STORE == "sqlite" else MemoryBucketStore(),
+        {
+            "read": {
+                "per_minute": RATE_LIMIT_READ_PER_MINUTE,
+                "burst": RATE_LIMIT_READ_BURST,
+                "global_per_second": RATE_LIMIT_GLOBAL_READ_PER_SECOND,
+            },
+            "write": {
+                "per_minute": RATE_LIMIT_WRITE_PER_MINUTE,
+                "burst": RATE_LIMIT_WRITE_BURST,
+                "global_per_second": RATE_LIMIT_GLOBAL_WRITE_PER_SECOND,
+            },
+        }
+    )
+
+
+async def caller_address(request: Request) -> Optional[str]:
+    """Address the request acts for, from path, query or JSON body"""
+    for source in (request.path_params, request.query_params):
+        for field in ADDRESS_FIELDS:
+            if source.get(field):
+                return source[field]
+    if request.method in ("POST", "PUT", "DELETE"):
+        try:
+            # Starlette caches the body, the endpoint still gets to parse it
+            body = json.loads(await request.body() or b"null")
+        except ValueError:
+            return None
+        if isinstance(body, dict):
+            for field in ADDRESS_FIELDS:
+                if isinstance(body.get(field), str):
+                    return body[field]
+    return None
+
+
+# ==================== Dependencies ====================
+
+async def limit_reads(request: Request):
+    if limiter is not None:
+        await limiter.check("read", request.client.host if request.client else None, await caller_address(request))
+
+
+async def limit_writes(request: Request):
+    if limiter is not None:
+        await limiter.check("write", request.client.host if request.client else None, await caller_address(request))
@@ -0,0 +1,167 @@
+"""
+JSON-RPC batching for contract view calls.
+
+Collects the eth_calls a request handler needs and sends them to the node as a
+single JSON-RPC batch POST, then demultiplexes the responses by request id.
+"""
+import asyncio
+import json
+import os
+from typing import Any, Callable, List, Optional, Tuple
+
+import aiohttp
+from hexbytes import HexBytes
+from web3 import AsyncHTTPProvider
+from web3._utils.abi import get_abi_output_types, map_abi_data
+from web3._utils.contract_error_handling import raise_contract_logic_error_on_revert
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+try:
+    from config import RPC_BATCH_MAX_SIZE, RPC_POOL_SIZE
+except ImportError:
+    RPC_BATCH_MAX_SIZE = int(os.getenv("RPC_BATCH_MAX_SIZE", "100"))
+    RPC_POOL_SIZE = int(os.getenv("RPC_POOL_SIZE", "64"))
+
+
+class AsyncBatchingHTTPProvider(AsyncHTTPProvider):
+    """AsyncHTTPProvider that can also send several JSON-RPC requests in one POST
+
+    All requests go through one aiohttp.ClientSession, so every coroutine shares a
+    single keep-alive connection pool. The session is created on first use because
+    it has to be bound to the running event loop.
+    """
+
+    def __init__(self, endpoint_uri: str, request_kwargs: dict = None,
+                 session_factory: Callable[[], aiohttp.ClientSession] = aiohttp.ClientSession):
+        super().__init__(endpoint_uri, request_kwargs=request_kwargs)
+        self.session_factory = session_factory
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            self.session = self.session_factory()
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+        self.session = None
+
+    async def _post(self, data: bytes) -> bytes:
+        async with self.get_session().post(self.endpoint_uri, data=data, **self.get_request_kwargs()) as response:
+            response.raise_for_status()
+            return await response.read()
+
+    async def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        return self.decode_rpc_response(await self._post(request_data))
+
+    async def make_batch_request(self, batch: List[Tuple[str, Any]]) -> List[dict]:
+        """Send (method, params) pairs as one batch, responses come back in request order"""
+        payload = [
+            {"jsonrpc": "2.0", "method": method, "params": params, "id": next(self.request_counter)}
+            for method, params in batch
+        ]
+        responses = json.loads(await self._post(json.dumps(payload).encode()))
+        if isinstance(responses, dict):
+            # Some nodes answer a whole batch with a single error object
+            raise ValueError(responses.get("error", responses))
+
+        # Batch responses may arrive in any order
+        by_id = {response.get("id"): response for response in responses}
+        return [
+            by_id.get(request["id"], {"error": {"message": "Missing response in batch"}})
+            for request in payload
+        ]
+
+
+class BatchCall:
+    """Result slot for one call in a CallBatch"""
+
+    def __init__(self, function):
+        self.function = function
+        self.value = None
+        self.error = None
+
+    def result(self):
+        """Return the decoded value, or raise the error the call failed with"""
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class CallBatch:
+    """Collects contract view calls and executes them in one JSON-RPC batch
+
+    Usage:
+        batch = CallBatch(w3)
+        exists = batch.add(contract.functions.checkUserExists(address))
+        user = batch.add(contract.functions.getUser(address))
+        await batch.execute()
+        exists.result()
+    """
+
+    def __init__(self, w3, max_batch_size: int = RPC_BATCH_MAX_SIZE, max_concurrency: int = RPC_POOL_SIZE):
+        self.w3 = w3
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.calls: List[BatchCall] = []
+
+    def add(self, function) -> BatchCall:
+        call = BatchCall(function)
+        self.calls.append(call)
+        return call
+
+    def _decode(self, function, return_data: HexBytes):
+        """Decode return data the same way ContractFunction.call() does"""
+        output_types = get_abi_output_types(function.abi)
+        output_data = self.w3.codec.decode(output_types, return_data)
+        normalized = map_abi_data(BASE_RETURN_NORMALIZERS, output_types, output_data)
+        return normalized[0] if len(normalized) == 1 else normalized
+
+    async def execute(self) -> List[BatchCall]:
+        """Send all collected calls, filling in each call's value or error"""
+        provider = self.w3.provider
+        if not self.calls:
+            return self.calls
+
+        if not hasattr(provider, "make_batch_request"):
+            # Provider cannot batch, fall back to one request per call
+            for call in self.calls:
+                try:
+                    call.value = await call.function.call()
+                except Exception as e:
+                    call.error = e
+            return self.calls
+
+        batch = [
+            ("eth_call", [{"to": call.function.address, "data": call.function._encode_transaction_data()}, "latest"])
+            for call in self.calls
+        ]
+        # Chunks beyond the provider's batch cap go out concurrently, at most one per
+        # pooled connection; gather keeps the chunk responses in chunk order
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def send(chunk):
+            async with semaphore:
+                return await provider.make_batch_request(chunk)
+
+        chunks = [batch[start:start + self.max_batch_size] for start in range(0, len(batch), self.max_batch_size)]
+        responses = [response for chunk in await asyncio.gather(*(send(chunk) for chunk in chunks)) for response in chunk]
+
+        for call, response in zip(self.calls, responses):
+            try:
+                if "error" in response:
+                    raise_contract_logic_error_on_revert(response)
+                    raise ValueError(response["error"])
+                call.value = self._decode(call.function, HexBytes(response["result"]))
+            except Exception as e:
+                call.error = e
+        return self.calls
+
+
+async def batch_call(w3, *functions) -> List[BatchCall]:
+    """Execute several contract view calls in one round trip"""
+    batch = CallBatch(w3)
+    for function in functions:
+        batch.add(function)
+    return await batch.execute()
@@ -0,0 +1,347 @@
+"""
+Multi-endpoint RPC routing with failover.
+
+Reads go to the healthy endpoint with the lowest EWMA latency. Transactions are
+kept on one endpoint per sender (set through the rpc_affinity context variable)
+so nonce lookups, broadcast and receipt polling all see the same node. A
+background probe marks endpoints unhealthy when they error or fall behind the
+highest block seen across all endpoints.
+
+Every call honours the deadline of the request it belongs to (rpc_deadline) and
+goes through a circuit breaker that fails fast while the upstream is down.
+"""
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import aiohttp
+from fastapi import HTTPException, status
+from web3.providers.async_base import AsyncJSONBaseProvider
+from rpcbatch import AsyncBatchingHTTPProvider
+import metrics
+import timing
+
+logger = logging.getLogger(__name__)
+
+# Sender address of the transaction being sent in the current task, if any
+rpc_affinity: ContextVar[Optional[str]] = ContextVar("rpc_affinity", default=None)
+
+# time.monotonic() by which the current request must be answered, if any
+rpc_deadline: ContextVar[Optional[float]] = ContextVar("rpc_deadline", default=None)
+
+# Transport-level failures that should trigger failover (JSON-RPC errors such as
+# reverts are valid answers and are returned to the caller untouched)
+FAILOVER_ERRORS = (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError)
+
+
+class DeadlineExceeded(HTTPException):
+    """The request ran out of time waiting for the node"""
+
+    def __init__(self, detail: str = "Request deadline exceeded while waiting for the blockchain node"):
+        super().__init__(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail=detail)
+
+
+class CircuitOpenError(HTTPException):
+    """The circuit breaker is open - fail fast instead of waiting on a dead node"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Blockchain node unavailable, retry later",
+            headers={"Retry-After": str(retry_after)}
+        )
+
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, None without one"""
+    deadline = rpc_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class CircuitBreaker:
+    """Opens after consecutive failed RPC dispatches, then lets one trial call through
+
+    closed -> open after `threshold` failures in a row
+    open -> half-open once `cooldown` seconds have passed
+    half-open -> closed if the trial call succeeds, open again if it fails
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+
+    def is_open(self) -> bool:
+        """Calls are currently being rejected (the cooldown has not run out yet)"""
+        return self.state == self.OPEN and time.monotonic() - self.opened_at < self.cooldown
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.opened_at + self.cooldown - time.monotonic()))
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError when calls must fail fast; True if this call is the half-open trial"""
+        if self.state == self.OPEN:
+            if self.is_open():
+                raise CircuitOpenError(self.retry_after())
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._trial_in_flight:
+                raise CircuitOpenError(1)
+            self._trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self, trial: bool):
+        """Free the half-open trial slot once its call has finished, however it finished"""
+        if trial:
+            self._trial_in_flight = False
+
+    def record_success(self, trial: bool):
+        self.failures = 0
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self, trial: bool):
+        self.failures += 1
+        if trial or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def _set_state(self, state: str):
+        self.state = state
+        metrics.RPC_CIRCUIT_STATE.set({self.CLOSED: 0, self.HALF_OPEN: 1, self.OPEN: 2}[state])
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "retry_after": self.retry_after() if self.is_open() else None,
+        }
+
+
+class RPCEndpoint:
+    """One RPC URL with its health and latency statistics"""
+
+    def __init__(self, url: str, session_factory: Callable[[], aiohttp.ClientSession], ewma_alpha: float):
+        self.url = url
+        # Host only - provider URLs often carry API keys in the path
+        self.label = urlparse(url).netloc or url
+        self.provider = AsyncBatchingHTTPProvider(url, session_factory=session_factory)
+        self.ewma_alpha = ewma_alpha
+        self.latency_ewma: Optional[float] = None
+        self.consecutive_failures = 0
+        self.healthy = True
+        self.block_number: Optional[int] = None
+        self.block_lag = 0
+        self.last_error: Optional[str] = None
+
+    def record_success(self, latency: float):
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = self.ewma_alpha * latency + (1 - self.ewma_alpha) * self.latency_ewma
+        self.consecutive_failures = 0
+
+    def record_failure(self, error: Exception, max_failures: int):
+        self.consecutive_failures += 1
+        self.last_error = str(error) or type(error).__name__
+        if self.consecutive_failures >= max_failures:
+            self.healthy = False
+
+    def status(self) -> dict:
+        return {
+            # Host only, this is served on the public health endpoints
+            "endpoint": self.label,
+            "healthy": self.healthy,
+            "latency_ms": round(self.latency_ewma * 1000, 2) if self.latency_ewma is not None else None,
+            "block_number": self.block_number,
+            "block_lag": self.block_lag,
+            "consecutive_failures": self.consecutive_failures,
+            "last_error": self.last_error,
+        }
+
+
+class RPCRouter(AsyncJSONBaseProvider):
+    """AsyncWeb3 provider that spreads requests over several RPC endpoints"""
+
+    def __init__(self, urls: List[str], session_factory: Callable[[], aiohttp.ClientSession],
+                 ewma_alpha: float = 0.3, max_failures: int = 3, max_block_lag: int = 5,
+                 probe_interval: float = 10.0, max_sticky_senders: int = 10000,
+                 breaker_threshold: int = 5, breaker_cooldown: float = 30.0):
+        super().__init__()
+        if not urls:
+            raise ValueError("At least one RPC endpoint is required")
+        self.endpoints = [RPCEndpoint(url, session_factory, ewma_alpha) for url in urls]
+        self.max_failures = max_failures
+        self.max_block_lag = max_block_lag
+        self.probe_interval = probe_interval
+        self.max_sticky_senders = max_sticky_senders
+        self._sticky: "OrderedDict[str, RPCEndpoint]" = OrderedDict()
+        # Wall-clock time of the last completed probe, None until the first one
+        self.last_probe_at: Optional[float] = None
+        self.breaker = CircuitBreaker(breaker_threshold, breaker_cooldown)
+        self._probe_task: Optional[asyncio.Task] = None
+
+    def __str__(self) -> str:
+        return f"RPC router over {', '.join(endpoint.url for endpoint in self.endpoints)}"
+
+    # ==================== Endpoint Selection ====================
+
+    def _ranked(self) -> List[RPCEndpoint]:
+        """Healthy endpoints fastest first, unhealthy ones kept as a last resort"""
+        def latency(endpoint):
+            # Endpoints without samples yet sort first so they get measured
+            return endpoint.latency_ewma if endpoint.latency_ewma is not None else 0.0
+        healthy = sorted((e for e in self.endpoints if e.healthy), key=latency)
+        unhealthy = sorted((e for e in self.endpoints if not e.healthy), key=lambda e: e.consecutive_failures)
+        return healthy + unhealthy
+
+    def _candidates(self) -> List[RPCEndpoint]:
+        ranked = self._ranked()
+        sender = rpc_affinity.get()
+        if sender is None:
+            return ranked
+
+        pinned = self._sticky.get(sender)
+        if pinned is None or not pinned.healthy:
+            pinned = ranked[0]
+            self._sticky[sender] = pinned
+            if len(self._sticky) > self.max_sticky_senders:
+                self._sticky.popitem(last=False)
+        self._sticky.move_to_end(sender)
+        return [pinned] + [endpoint for endpoint in ranked if endpoint is not pinned]
+
+    async def _dispatch(self, requests: List[Tuple[str, Any]], send: Callable[[AsyncBatchingHTTPProvider], Any]):
+        """Try endpoints in preference order until one answers, within the request deadline"""
+        self.start_probing()
+        method = requests[0][0] if len(requests) == 1 else "batch"
+        trial = self.breaker.before_call()
+        try:
+            result = await self._attempt(requests, send, method)
+        except DeadlineExceeded:
+            # A short client deadline must not open the breaker for everyone
+            raise
+        except Exception:
+            self.breaker.record_failure(trial)
+            raise
+        finally:
+            # Also runs when the call is cancelled, e.g. by a client disconnect
+            self.breaker.release_trial(trial)
+        self.breaker.record_success(trial)
+        return result
+
+    async def _attempt(self, requests, send, method: str):
+        last_error = None
+        for endpoint in self._candidates():
+            remaining = remaining_time()
+            if remaining is not None and remaining <= 0:
+                raise DeadlineExceeded()
+            start = time.perf_counter()
+            try:
+                result = await asyncio.wait_for(send(endpoint.provider), timeout=remaining)
+            except asyncio.TimeoutError as e:
+                # The caller's own budget ran out, which says nothing about the endpoint
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    raise DeadlineExceeded()
+                # Otherwise the endpoint's own read/connect timeout fired
+                endpoint.record_failure(e, self.max_failures)
+                metrics.RPC_ERRORS.inc(method=method, endpoint=endpoint.label, kind="timeout")
+                last_error = e
+                continue
+            except FAILOVER_ERRORS as e:
+                endpoint.record_failure(e, self.max_failures)
+                metrics.RPC_ERRORS.inc(method=method, endpoint=endpoint.label, kind="transport")
+                last_error = e
+                continue
+            duration = time.perf_counter() - start
+            endpoint.record_success(duration)
+            self._observe(requests, result, endpoint, method, duration)
+            return result
+        raise last_error
+
+    def _observe(self, requests, result, endpoint: RPCEndpoint, method: str, duration: float):
+        """Record latency and JSON-RPC errors for a completed request or batch"""
+        metrics.RPC_REQUEST_DURATION.observe(duration, method=method, endpoint=endpoint.label)
+        responses = result if isinstance(result, list) else [result]
+        for (request_method, params), response in zip(requests, responses):
+            if isinstance(response, dict) and "error" in response:
+                metrics.RPC_ERRORS.inc(method=request_method, endpoint=endpoint.label, kind="rpc")
+            function = metrics.contract_function_name(request_method, params)
+            if function:
+                metrics.CONTRACT_FUNCTION_DURATION.observe(duration, function=function, type="call")
+                timing.record(f"call.{function}", duration)
+
+    # ==================== Provider Interface ====================
+
+    async def make_request(self, method, params):
+        return await self._dispatch([(method, params)], lambda provider: provider.make_request(method, params))
+
+    async def make_batch_request(self, batch: List[Tuple[str, Any]]) -> List[dict]:
+        return await self._dispatch(batch, lambda provider: provider.make_batch_request(batch))
+
+    # ==================== Health Probing ====================
+
+    async def _probe_endpoint(self, endpoint: RPCEndpoint):
+        start = time.perf_counter()
+        try:
+            response = await endpoint.provider.make_request("eth_blockNumber", [])
+            if "error" in response:
+                raise ValueError(response["error"])
+            endpoint.block_number = int(response["result"], 16)
+        except FAILOVER_ERRORS as e:
+            endpoint.record_failure(e, self.max_failures)
+            metrics.RPC_ERRORS.inc(method="eth_blockNumber", endpoint=endpoint.label, kind="probe")
+            endpoint.healthy = False
+            return
+        endpoint.record_success(time.perf_counter() - start)
+
+    async def probe(self):
+        """Refresh every endpoint's head block and mark failing or lagging ones unhealthy"""
+        await asyncio.gather(*(self._probe_endpoint(endpoint) for endpoint in self.endpoints))
+        heads = [e.block_number for e in self.endpoints if e.block_number is not None and e.consecutive_failures == 0]
+        head = max(heads) if heads else None
+        for endpoint in self.endpoints:
+            if endpoint.consecutive_failures or head is None or endpoint.block_number is None:
+                continue
+            endpoint.block_lag = head - endpoint.block_number
+            endpoint.healthy = endpoint.block_lag <= self.max_block_lag
+        self.last_probe_at = time.time()
+
+    def start_probing(self):
+        """Start the background probe loop on the running event loop unless it is already running"""
+        if self._probe_task is None or self._probe_task.done():
+            self._probe_task = asyncio.get_running_loop().create_task(self.run_forever())
+
+    async def run_forever(self):
+        """Background probe loop, started by the first RPC call or readiness check"""
+        while True:
+            try:
+                await self.probe()
+            except Exception:
+                logger.exception("RPC endpoint probe failed")
+            await asyncio.sleep(self.probe_interval)
+
+    def status(self) -> List[dict]:
+        return [endpoint.status() for endpoint in self.endpoints]
+
+    def head_block(self) -> Optional[int]:
+        """Highest block seen on any endpoint by the last probe"""
+        blocks = [endpoint.block_number for endpoint in self.endpoints if endpoint.block_number is not None]
+        return max(blocks) if blocks else None
+
+    async def close(self):
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+        for endpoint in self.endpoints:
+            await endpoint.provider.close()
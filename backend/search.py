@@ -0,0 +1,90 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+import asyncio
+import timing
+import blockchain
+from ratelimit import limit_reads
+from singleflight import reads
+from Registrations import check_contract_initialized
+from indexer import MessageIndexer, get_message_index, normalize_id
+
+app = APIRouter()
+
+
+def get_indexer():
+    """Indexer feeding the search index, or None when search or the contract is not configured"""
+    index = get_message_index()
+    if index is None or blockchain.contract is None:
+        return None
+    return MessageIndexer(blockchain.w3, blockchain.contract, index)
+
+
+async def run_indexer():
+    """Keep the search index in sync in the background; returns at once when there is nothing to index"""
+    # Built inside the task so the RPC client is not constructed during startup
+    indexer = get_indexer()
+    if indexer is not None:
+        await indexer.run_forever()
+
+
+# ==================== Search API Endpoints ====================
+
+@app.get("/search", dependencies=[Depends(limit_reads)])
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=256),
+    address: str = Query(...),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+):
+    """Full-text search over the chats and groups the address takes part in"""
+    check_contract_initialized()
+    index = get_message_index()
+    if index is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Search index is disabled. Set SEARCH_INDEX_ENABLED=true"
+        )
+
+    try:
+        groups = await reads.do(
+            "getUserGroups", address.lower(),
+            lambda: blockchain.contract.functions.getUserGroups(address).call()
+        )
+        group_ids = [normalize_id(group[2]) for group in groups]
+
+        # Fetch one extra row to know whether another page exists
+        with timing.span("search.index"):
+            rows = await asyncio.to_thread(
+                index.search, q, address, group_ids, limit + 1, offset
+            )
+
+        results = []
+        for row in rows[:limit]:
+            results.append({
+                "chat_id": "0x" + row["chat_id"],
+                "type": row["kind"],
+                "sender": row["sender"],
+                "receiver": row["receiver"],
+                "content": row["content"],
+                "snippet": row["snippet"],
+                "timestamp": row["timestamp"],
+                "block_number": row["block_number"],
+                "transaction_hash": row["transaction_hash"],
+                "score": row["score"]
+            })
+
+        return {
+            "query": q,
+            "address": address,
+            "limit": limit,
+            "offset": offset,
+            "has_more": len(rows) > limit,
+            "result_count": len(results),
+            "results": results
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Search failed: {str(e)}"
+        )
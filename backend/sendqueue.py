@@ -0,0 +1,87 @@
+"""
+Per-sender send queue.
+
+Sends that share a queue key (the signing account and the message sender) go out
+one transaction at a time. Whatever queues up while a transaction is in flight is
+flushed together as the next transaction (sendMessages / sendGroupMessages), so a
+burst of messages from one account costs one transaction base fee and one receipt
+wait instead of one each. A lone send is not delayed.
+"""
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional
+
+import metrics
+import timing
+from rpcrouter import DeadlineExceeded, remaining_time, rpc_deadline
+try:
+    from config import SEND_BATCH_MAX_SIZE
+except ImportError:
+    SEND_BATCH_MAX_SIZE = int(os.getenv("SEND_BATCH_MAX_SIZE", "50"))
+
+
+# Batch gas limits are estimated, with this much headroom on top
+GAS_HEADROOM = 1.2
+
+
+async def batch_gas_limit(function, sender: str) -> int:
+    """Gas limit for a batch transaction, which can outgrow send_transaction's fixed default"""
+    return int(await function.estimate_gas({'from': sender}) * GAS_HEADROOM)
+
+
+class PendingSend:
+    """One queued send and the future its request is waiting on"""
+
+    def __init__(self, payload: Any):
+        self.payload = payload
+        self.deadline: Optional[float] = rpc_deadline.get()
+        self.future = asyncio.get_running_loop().create_future()
+
+
+class SendQueue:
+    """Serializes sends per key and flushes everything queued meanwhile as one batch"""
+
+    def __init__(self, max_batch: int = SEND_BATCH_MAX_SIZE):
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[Hashable, List[PendingSend]] = {}
+        self._workers: Dict[Hashable, asyncio.Task] = {}
+
+    async def submit(self, key: Hashable, payload: Any, flush: Callable[[List[Any]], Awaitable[dict]]) -> dict:
+        """Queue a send and wait for the transaction that carries it"""
+        pending = PendingSend(payload)
+        self._pending.setdefault(key, []).append(pending)
+        if key not in self._workers:
+            self._workers[key] = asyncio.ensure_future(self._drain(key, flush))
+
+        with timing.span("send.queue"):
+            try:
+                # The transaction goes ahead even if this request gives up waiting
+                return await asyncio.wait_for(asyncio.shield(pending.future), timeout=remaining_time())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded()
+
+    async def _drain(self, key: Hashable, flush: Callable[[List[Any]], Awaitable[dict]]):
+        try:
+            while self._pending.get(key):
+                batch = self._pending[key][:self.max_batch]
+                del self._pending[key][:self.max_batch]
+                # The batch may run as long as its most patient request allows
+                deadlines = [pending.deadline for pending in batch]
+                rpc_deadline.set(None if None in deadlines else max(deadlines))
+                metrics.SEND_BATCH_SIZE.observe(len(batch))
+                try:
+                    result = await flush([pending.payload for pending in batch])
+                except Exception as e:
+                    for pending in batch:
+                        if not pending.future.done():
+                            pending.future.set_exception(e)
+                else:
+                    for pending in batch:
+                        if not pending.future.done():
+                            pending.future.set_result(result)
+        finally:
+            self._workers.pop(key, None)
+            self._pending.pop(key, None)
+
+
+sends = SendQueue()
@@ -0,0 +1,43 @@
+"""
+Request coalescing for identical concurrent reads.
+
+While a read for a key is in flight, further requests for the same key await the
+same task instead of sending their own eth_call, and all of them get its decoded
+result (or its exception). Nothing is cached once the call completes.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+import metrics
+import timing
+from rpcrouter import DeadlineExceeded, remaining_time
+
+
+class SingleFlight:
+    """Shares one in-flight call between concurrent callers with the same key"""
+
+    def __init__(self):
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+
+    async def do(self, name: str, key: Hashable, call: Callable[[], Awaitable[Any]]):
+        flight_key = (name, key)
+        task = self._inflight.get(flight_key)
+        shared = task is not None
+        metrics.record_cache(f"singleflight_{name}", shared)
+
+        if not shared:
+            # Own task, so one caller going away does not cancel the call for the others
+            task = asyncio.ensure_future(call())
+            self._inflight[flight_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(flight_key, None))
+            return await asyncio.shield(task)
+
+        # Followers still honour their own request deadline
+        with timing.span(f"shared.{name}"):
+            try:
+                return await asyncio.wait_for(asyncio.shield(task), timeout=remaining_time())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded()
+
+
+reads = SingleFlight()
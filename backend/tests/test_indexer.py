@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+from hexbytes import HexBytes
+
+import blobstore
+import blockchain
+from indexer import MessageIndex, MessageIndexer, normalize_id
+
+ALICE = '0x' + '11' * 20
+BOB = '0x' + '33' * 20
+CHAT_ID = bytes(blockchain.chat_id_for(ALICE, BOB))
+
+
+class FakeEvent:
+    def __init__(self, logs):
+        self.logs = logs
+
+    async def get_logs(self, fromBlock, toBlock):
+        return [log for log in self.logs if fromBlock <= log['blockNumber'] <= toBlock]
+
+
+class FakeEth:
+    def __init__(self, latest):
+        self.latest = latest
+
+    @property
+    def block_number(self):
+        async def latest():
+            return self.latest
+        return latest()
+
+    async def get_transaction(self, tx_hash):
+        return {'input': tx_hash}
+
+
+def _log(block, args):
+    return {'blockNumber': block, 'logIndex': 0, 'transactionHash': HexBytes(bytes([block]) * 32), 'args': args}
+
+
+def _send(block, content):
+    return _log(block, {'chatId': CHAT_ID, 'sender': ALICE, 'content': content, 'timestamp': 1000 + block})
+
+
+def _indexer(index, calls, sent, hashed, deleted):
+    latest = max(log['blockNumber'] for log in sent + hashed + deleted)
+    contract = SimpleNamespace(
+        events=SimpleNamespace(
+            MessageSent=FakeEvent(sent), MessageHashSent=FakeEvent(hashed), MessageDeleted=FakeEvent(deleted)
+        ),
+        decode_function_input=lambda tx_input: calls[bytes(tx_input)],
+    )
+    return MessageIndexer(SimpleNamespace(eth=FakeEth(latest)), contract, index, start_block=0, chunk_size=2)
+
+
+def test_deleted_messages_drop_out_of_search(tmp_path, monkeypatch):
+    # The body of the hash-only message is not held here, it is skipped but keeps its slot
+    monkeypatch.setattr(blobstore, 'get_blob_store', lambda: SimpleNamespace(get_many=lambda hashes: {}))
+    send_message = SimpleNamespace(fn_name='sendMessage')
+    params = {'_sender': ALICE, '_receiver': BOB, 'isMedia': False}
+    sent = [_send(1, 'hello world'), _send(3, 'secret plan'), _send(4, 'plan b')]
+    hashed = [_log(2, {'chatId': CHAT_ID, 'sender': ALICE, 'contentHash': b'\x01' * 32,
+                       'messageIndex': 1, 'timestamp': 1002})]
+    deleted = [_log(5, {'chatId': CHAT_ID, 'deleter': ALICE, 'messageIndex': 2})]
+    calls = {bytes([block]) * 32: (send_message, params) for block in (1, 3, 4)}
+
+    index = MessageIndex(str(tmp_path / 'index.db'))
+    indexer = _indexer(index, calls, sent, hashed, deleted)
+    assert asyncio.run(indexer.sync_once()) == 3
+
+    positions = {
+        row['content']: (row['message_index'], row['deleted'])
+        for row in index._connection().execute("SELECT content, message_index, deleted FROM messages")
+    }
+    assert positions == {'hello world': (0, 0), 'secret plan': (2, 1), 'plan b': (3, 0)}
+
+    results = index.search('plan', BOB, [])
+    assert [row['content'] for row in results] == ['plan b']
+    assert [row['content'] for row in index.search('hello', BOB, [])] == ['hello world']
+    assert normalize_id(results[0]['chat_id']) == normalize_id(CHAT_ID)
@@ -0,0 +1,73 @@
+"""
+Per-request timing spans.
+
+The request middleware in main.py opens a recorder for each request; code on the
+request path records named spans into it (transaction phases, contract calls).
+The spans are returned in a Server-Timing header and logged for slow requests.
+Outside a request (background tasks) recording is a no-op.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+# Spans of the request being handled in the current task, if any. The list is
+# shared (not copied) with tasks spawned by the request, e.g. asyncio.gather.
+_spans: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("request_spans", default=None)
+
+
+def start_request():
+    """Start collecting spans for the current request, returns a reset token"""
+    return _spans.set([])
+
+
+def finish_request(token) -> List[Tuple[str, float]]:
+    """Stop collecting and return the (name, seconds) spans recorded"""
+    spans = _spans.get() or []
+    _spans.reset(token)
+    return spans
+
+
+def record(name: str, duration: float):
+    spans = _spans.get()
+    if spans is not None:
+        spans.append((name, duration))
+
+
+@contextmanager
+def span(name: str):
+    """Time the enclosed block, awaits included"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+async def timed(name: str, awaitable):
+    """Await and time a single awaitable, for phases that run concurrently"""
+    with span(name):
+        return await awaitable
+
+
+def summarize(spans: List[Tuple[str, float]]) -> List[dict]:
+    """Merge spans by name, keeping first-seen order"""
+    merged = {}
+    for name, duration in spans:
+        entry = merged.setdefault(name, {"name": name, "duration_ms": 0.0, "count": 0})
+        entry["duration_ms"] += duration * 1000
+        entry["count"] += 1
+    for entry in merged.values():
+        entry["duration_ms"] = round(entry["duration_ms"], 2)
+    return list(merged.values())
+
+
+def server_timing_header(summary: List[dict], total_ms: float) -> str:
+    parts = []
+    for entry in summary:
+        part = f"{entry['name']};dur={entry['duration_ms']}"
+        if entry["count"] > 1:
+            part += f';desc="x{entry["count"]}"'
+        parts.append(part)
+    parts.append(f"total;dur={round(total_ms, 2)}")
+    return ", ".join(parts)
@@ -6,14 +6,20 @@ contract Whatsapp {
     address public sender;
     address public receiver;
     uint256 constant DAY_IN_SECONDS = 86400;
-    
+
+    // Message.flags bits
+    uint8 constant MESSAGE_READ = 1;
+    uint8 constant MESSAGE_DELETED = 2;
+    uint8 constant MESSAGE_MEDIA = 4;
+    // content is kept off chain, messageHashes holds its keccak256
+    uint8 constant MESSAGE_HASHED = 8;
+
+    // sender, timestamp and flags share one storage slot
     struct Message {
         address sender;
+        uint40 timestamp;
+        uint8 flags;
         string content;
-        uint256 timestamp;
-        bool isRead;
-        bool isDeleted;
-        bool isMedia;
     }
     constructor() {
         sender = msg.sender;
@@ -48,14 +54,24 @@ contract Whatsapp {
     mapping(address => User) private users;
     mapping(bytes32 => Chat) private chats;
     mapping(bytes32 => Archive) private archives;
-    mapping(address => Group[]) private userGroups;
+    mapping(bytes32 => Group) private groups;
+    mapping(address => bytes32[]) private userGroupIds;
+    mapping(bytes32 => mapping(address => bool)) private groupMembers;
+    mapping(bytes32 => bool) private deletedGroups;
     mapping(bytes32 => Message[]) private groupMessages;
+    mapping(bytes32 => mapping(uint256 => bytes32)) private messageHashes;
+    // number of messages each participant has read in a chat, one slot per participant
+    mapping(bytes32 => mapping(address => uint256)) private chatReadCursors;
+    mapping(bytes32 => mapping(address => uint256)) private groupReadCursors;
 
     event UserRegistered(address indexed userAddress, string name);
     event MessageSent(bytes32 indexed chatId, address indexed sender, string content, uint256 timestamp);
+    event MessageHashSent(bytes32 indexed chatId, address indexed sender, bytes32 contentHash, uint256 messageIndex, uint256 timestamp);
     event MessageRead(bytes32 indexed chatId, address indexed reader, uint256 messageIndex);
+    event MessagesReadUpTo(bytes32 indexed chatId, address indexed reader, uint256 messageIndex);
     event MessageDeleted(bytes32 indexed chatId, address indexed deleter, uint256 messageIndex);
     event GroupCreated(string groupName, address[] members);
+    event GroupDeleted(bytes32 indexed groupId, address indexed admin);
     event UserStatusUpdated(address indexed userAddress, string newStatus);
     event UserProfilePictureUpdated(address indexed userAddress, string newProfilePicture);
     event ChatArchived(bytes32 indexed chatId, address indexed userAddress, bool isArchived);
@@ -87,8 +103,28 @@ contract Whatsapp {
     function sendMessage(address _sender, address _receiver, string memory content, bool isMedia) external {
         require(users[_sender].userAddress != address(0), "Sender not registered");
         require(users[_receiver].userAddress != address(0), "Receiver not registered");
-        bytes32 chatId = keccak256(abi.encodePacked(_sender, _receiver));
-        chats[chatId].messages.push(Message(_sender, content, block.timestamp, false, false, isMedia));
+        _storeMessage(_sender, _receiver, content, isMedia);
+    }
+
+    // many messages from one sender in a single transaction, the sender is checked once
+    // and a receiver only when it differs from the previous one
+    function sendMessages(address _sender, address[] calldata receivers, string[] calldata contents, bool[] calldata isMedia) external {
+        require(receivers.length > 0, "No messages to send");
+        require(receivers.length == contents.length && receivers.length == isMedia.length, "Array lengths do not match");
+        require(users[_sender].userAddress != address(0), "Sender not registered");
+        address checkedReceiver = address(0);
+        for (uint256 i = 0; i < receivers.length; i++) {
+            if (receivers[i] != checkedReceiver) {
+                require(users[receivers[i]].userAddress != address(0), "Receiver not registered");
+                checkedReceiver = receivers[i];
+            }
+            _storeMessage(_sender, receivers[i], contents[i], isMedia[i]);
+        }
+    }
+
+    function _storeMessage(address _sender, address _receiver, string memory content, bool isMedia) private {
+        bytes32 chatId = _chatId(_sender, _receiver);
+        chats[chatId].messages.push(Message(_sender, uint40(block.timestamp), isMedia ? MESSAGE_MEDIA : uint8(0), content));
         emit MessageSent(chatId, _sender, content, block.timestamp);
         if (chats[chatId].messages.length == 1) {
             chats[chatId].sender = _sender;
@@ -96,21 +132,72 @@ contract Whatsapp {
         }
     }
 
+    // like sendMessage, but only the keccak256 of the content is stored
+    function sendMessageHash(address _sender, address _receiver, bytes32 contentHash, bool isMedia) external {
+        require(users[_sender].userAddress != address(0), "Sender not registered");
+        require(users[_receiver].userAddress != address(0), "Receiver not registered");
+        bytes32 chatId = _chatId(_sender, _receiver);
+        uint256 messageIndex = chats[chatId].messages.length;
+        chats[chatId].messages.push(Message(_sender, uint40(block.timestamp), MESSAGE_HASHED | (isMedia ? MESSAGE_MEDIA : uint8(0)), ""));
+        messageHashes[chatId][messageIndex] = contentHash;
+        emit MessageHashSent(chatId, _sender, contentHash, messageIndex, block.timestamp);
+        if (messageIndex == 0) {
+            chats[chatId].sender = _sender;
+            chats[chatId].receiver = _receiver;
+        }
+    }
+
+    // log-only messaging: the message is emitted as MessageSent and nothing is stored,
+    // history is rebuilt from the logs (isMedia is in the transaction input; it is only
+    // read off-chain, so solc warns that it is unused, but the name keeps it in the ABI)
+    function logMessage(address _sender, address _receiver, string calldata content, bool isMedia) external {
+        require(users[_sender].userAddress != address(0), "Sender not registered");
+        require(users[_receiver].userAddress != address(0), "Receiver not registered");
+        emit MessageSent(_chatId(_sender, _receiver), _sender, content, block.timestamp);
+    }
+
+    // one chat per pair of users whichever of them sends: the two addresses are
+    // hashed in ascending order, so both directions share a message array and
+    // chats[chatId].sender / receiver are simply the two participants
+    function _chatId(address user1, address user2) private pure returns (bytes32) {
+        return user1 < user2 ? keccak256(abi.encodePacked(user1, user2)) : keccak256(abi.encodePacked(user2, user1));
+    }
+
+    function getChatId(address user1, address user2) external pure returns (bytes32) {
+        return _chatId(user1, user2);
+    }
+
     function readMessage(bytes32 chatId, uint256 messageIndex) external {
         require(chats[chatId].messages.length > messageIndex, "Message index out of bounds");
         require(chats[chatId].receiver == msg.sender || chats[chatId].sender == msg.sender, "Not a participant in this chat");
-        chats[chatId].messages[messageIndex].isRead = true;
+        chats[chatId].messages[messageIndex].flags |= MESSAGE_READ;
         emit MessageRead(chatId, msg.sender, messageIndex);
     }
 
+    // mark every message up to and including messageIndex as read in one write,
+    // the cursor never moves backwards
+    function readMessagesUpTo(bytes32 chatId, uint256 messageIndex) external {
+        require(chats[chatId].messages.length > messageIndex, "Message index out of bounds");
+        require(chats[chatId].receiver == msg.sender || chats[chatId].sender == msg.sender, "Not a participant in this chat");
+        if (chatReadCursors[chatId][msg.sender] <= messageIndex) {
+            chatReadCursors[chatId][msg.sender] = messageIndex + 1;
+        }
+        emit MessagesReadUpTo(chatId, msg.sender, messageIndex);
+    }
+
+    // messages below the returned index have been read by reader
+    function getReadCursor(bytes32 chatId, address reader) external view returns (uint256) {
+        return chatReadCursors[chatId][reader];
+    }
+
 
     function deleteMessage(bytes32 chatId, uint256 messageIndex, address deleter) external {
         require(chats[chatId].messages.length > messageIndex, "Message index out of bounds");
         if (chats[chatId].messages[messageIndex].sender == deleter) {
-            chats[chatId].messages[messageIndex].isDeleted = true;
+            chats[chatId].messages[messageIndex].flags |= MESSAGE_DELETED;
             emit MessageDeleted(chatId, deleter, messageIndex);
         } else if (chats[chatId].receiver == deleter || chats[chatId].sender == deleter) {
-            chats[chatId].messages[messageIndex].isDeleted = true;
+            chats[chatId].messages[messageIndex].flags |= MESSAGE_DELETED;
             emit MessageDeleted(chatId, deleter, messageIndex);
         } else {
             revert("only sender or receiver can delete this message");
@@ -125,62 +212,46 @@ contract Whatsapp {
             require(users[members[i]].userAddress != address(0), "All members must be registered users");
         }
         bytes32 groupId = keccak256(abi.encodePacked(groupName, members, block.timestamp));
-        Group memory newGroup = Group(groupName, members, groupId, groupDescription, admin);
+        require(groups[groupId].groupId == bytes32(0), "Group already exists");
+        // the group is stored once, members only keep its id
+        groups[groupId] = Group(groupName, members, groupId, groupDescription, admin);
         for (uint256 i = 0; i < members.length; i++) {
-            userGroups[members[i]].push(newGroup);
+            require(!groupMembers[groupId][members[i]], "Duplicate group member");
+            groupMembers[groupId][members[i]] = true;
+            userGroupIds[members[i]].push(groupId);
         }
         emit GroupCreated(groupName, members);
     }
     // leave group
     function leaveGroup(bytes32 groupId, address member) external {
-        bool isMember = false;
-        Group[] storage groups = userGroups[member];
-        for (uint256 i = 0; i < groups.length; i++) {
-            if (groups[i].groupId == groupId) {
-                isMember = true;
-                // Remove member from group
-                groups[i] = groups[groups.length - 1];
-                groups.pop();
+        require(_isActiveMember(groupId, member), "Member not found in the group");
+        groupMembers[groupId][member] = false;
+        _removeGroupId(member, groupId);
+        address[] storage members = groups[groupId].members;
+        for (uint256 i = 0; i < members.length; i++) {
+            if (members[i] == member) {
+                members[i] = members[members.length - 1];
+                members.pop();
                 break;
             }
         }
-        require(isMember, "Member not found in the group");
-        userGroups[member] = groups;
     }
 
 
     // create a new admin,this will be done by the current admin
     function createNewAdmin(bytes32 groupId, address newAdmin, address currentAdmin) external {
-        bool isMember = false;
-        Group[] storage groups = userGroups[currentAdmin];
-        for (uint256 i = 0; i < groups.length; i++) {
-            if (groups[i].groupId == groupId) {
-                isMember = true;
-                require(groups[i].admin == currentAdmin, "Only current admin can create new admin");
-                groups[i].admin = newAdmin;
-                break;
-            }
-        }
-        require(isMember, "Current admin not found in the group");
-        userGroups[currentAdmin] = groups;
+        require(_isActiveMember(groupId, currentAdmin), "Current admin not found in the group");
+        require(groups[groupId].admin == currentAdmin, "Only current admin can create new admin");
+        groups[groupId].admin = newAdmin;
     }
 
 
 
     // change group admin
     function changeGroupAdmin(bytes32 groupId, address newAdmin, address currentAdmin) external {
-        bool isMember = false;
-        Group[] storage groups = userGroups[currentAdmin];
-        for (uint256 i = 0; i < groups.length; i++) {
-            if (groups[i].groupId == groupId) {
-                isMember = true;
-                require(groups[i].admin == currentAdmin, "Only current admin can change admin");
-                groups[i].admin = newAdmin;
-                break;
-            }
-        }
-        require(isMember, "Current admin not found in the group");
-        userGroups[currentAdmin] = groups;
+        require(_isActiveMember(groupId, currentAdmin), "Current admin not found in the group");
+        require(groups[groupId].admin == currentAdmin, "Only current admin can change admin");
+        groups[groupId].admin = newAdmin;
     }
 
 
@@ -188,93 +259,221 @@ contract Whatsapp {
 
 
     function sendGroupMessage(bytes32 groupId, address  _sender, string memory content, bool isMedia) external {
-        bool isMember = false;
-        Group[] memory groups = userGroups[_sender];
-        for (uint256 i = 0; i < groups.length; i++) {
-            if (groups[i].groupId == groupId) {
-                isMember = true;
-                break;
-            }
+        require(_isActiveMember(groupId, _sender), "Sender is not a member of the group");
+        groupMessages[groupId].push(Message(_sender, uint40(block.timestamp), isMedia ? MESSAGE_MEDIA : uint8(0), content));
+        emit MessageSent(groupId, _sender, content, block.timestamp);
+    }
+
+    // several messages from one member in a single transaction, membership is checked once
+    function sendGroupMessages(bytes32 groupId, address _sender, string[] calldata contents, bool[] calldata isMedia) external {
+        require(contents.length > 0, "No messages to send");
+        require(contents.length == isMedia.length, "Array lengths do not match");
+        require(_isActiveMember(groupId, _sender), "Sender is not a member of the group");
+        Message[] storage messages = groupMessages[groupId];
+        for (uint256 i = 0; i < contents.length; i++) {
+            messages.push(Message(_sender, uint40(block.timestamp), isMedia[i] ? MESSAGE_MEDIA : uint8(0), contents[i]));
+            emit MessageSent(groupId, _sender, contents[i], block.timestamp);
         }
-        require(isMember, "Sender is not a member of the group");
-        groupMessages[groupId].push(Message(_sender, content, block.timestamp, false, false, isMedia));
+    }
+
+    function sendGroupMessageHash(bytes32 groupId, address _sender, bytes32 contentHash, bool isMedia) external {
+        require(_isActiveMember(groupId, _sender), "Sender is not a member of the group");
+        uint256 messageIndex = groupMessages[groupId].length;
+        groupMessages[groupId].push(Message(_sender, uint40(block.timestamp), MESSAGE_HASHED | (isMedia ? MESSAGE_MEDIA : uint8(0)), ""));
+        messageHashes[groupId][messageIndex] = contentHash;
+        emit MessageHashSent(groupId, _sender, contentHash, messageIndex, block.timestamp);
+    }
+
+    function logGroupMessage(bytes32 groupId, address _sender, string calldata content, bool isMedia) external {
+        require(_isActiveMember(groupId, _sender), "Sender is not a member of the group");
         emit MessageSent(groupId, _sender, content, block.timestamp);
     }
 
+    // deleting only sets a tombstone, so the cost does not depend on the group size;
+    // member lists, membership and messages of deleted groups are ignored on read
     function deleteGroup(bytes32 groupId, address admin) external {
-        bool isAdmin = false;
-        Group[] storage groups = userGroups[admin];
-        for (uint256 i = 0; i < groups.length; i++) {
-            if (groups[i].groupId == groupId) {
-                isAdmin = true;
-                require(groups[i].admin == admin, "Only admin can delete the group");
-                // Remove group from all members
-                for (uint256 j = 0; j < groups[i].members.length; j++) {
-                    address member = groups[i].members[j];
-                    Group[] storage memberGroups = userGroups[member];
-                    for (uint256 k = 0; k < memberGroups.length; k++) {
-                        if (memberGroups[k].groupId == groupId) {
-                            memberGroups[k] = memberGroups[memberGroups.length - 1];
-                            memberGroups.pop();
-                            break;
-                        }
-                    }
-                    userGroups[member] = memberGroups;
-                }
-                break;
+        require(_isActiveMember(groupId, admin), "Admin not found in the group");
+        require(groups[groupId].admin == admin, "Only admin can delete the group");
+        deletedGroups[groupId] = true;
+        emit GroupDeleted(groupId, admin);
+    }
+
+    // drop ids of deleted groups from a user's group list
+    function pruneDeletedGroups(address userAddress) external {
+        bytes32[] storage ids = userGroupIds[userAddress];
+        uint256 i = 0;
+        while (i < ids.length) {
+            if (deletedGroups[ids[i]]) {
+                ids[i] = ids[ids.length - 1];
+                ids.pop();
+            } else {
+                i++;
             }
         }
-        require(isAdmin, "Admin not found in the group");
-        userGroups[admin] = groups;
-        delete groupMessages[groupId];
     }
 
     function deleteGroupMessage(bytes32 groupId, uint256 messageIndex, address deleter) external {
         require(groupMessages[groupId].length > messageIndex, "Message index out of bounds");
-        bool isMember = false;
-        Group[] memory groups = userGroups[deleter];
-        for (uint256 i = 0; i < groups.length; i++) {
-            if (groups[i].groupId == groupId) {
-                isMember = true;
-                break;
-            }
-        }
-        require(isMember, "Deleter is not a member of the group");
+        require(_isActiveMember(groupId, deleter), "Deleter is not a member of the group");
         if (groupMessages[groupId][messageIndex].sender == deleter) {
-            groupMessages[groupId][messageIndex].isDeleted = true;
+            groupMessages[groupId][messageIndex].flags |= MESSAGE_DELETED;
             emit MessageDeleted(groupId, deleter, messageIndex);
         } else {
             revert("only sender can delete this message");
         }
     }
 
-    function markGroupMessageAsRead(bytes32 groupId, uint256 messageIndex, address reader) external {
+    // group reads are tracked per member: messages below a member's cursor count as
+    // read for that member, and one call catches up on everything up to messageIndex
+    function readGroupMessagesUpTo(bytes32 groupId, uint256 messageIndex) external {
         require(groupMessages[groupId].length > messageIndex, "Message index out of bounds");
-        bool isMember = false;
-        Group[] memory groups = userGroups[reader];
-        for (uint256 i = 0; i < groups.length; i++) {
-            if (groups[i].groupId == groupId) {
-                isMember = true;
-                break;
+        require(_isActiveMember(groupId, msg.sender), "Reader is not a member of the group");
+        if (groupReadCursors[groupId][msg.sender] <= messageIndex) {
+            groupReadCursors[groupId][msg.sender] = messageIndex + 1;
+        }
+        emit MessagesReadUpTo(groupId, msg.sender, messageIndex);
+    }
+
+    // membership flags are left in place by deleteGroup, so the tombstone is checked here;
+    // non-members stop at the first read, members pay one extra read for the tombstone
+    function _isActiveMember(bytes32 groupId, address member) private view returns (bool) {
+        return groupMembers[groupId][member] && !deletedGroups[groupId];
+    }
+
+    // swap-and-pop the group id out of the member's list
+    function _removeGroupId(address member, bytes32 groupId) private {
+        bytes32[] storage ids = userGroupIds[member];
+        for (uint256 i = 0; i < ids.length; i++) {
+            if (ids[i] == groupId) {
+                ids[i] = ids[ids.length - 1];
+                ids.pop();
+                return;
             }
         }
-        require(isMember, "Reader is not a member of the group");
-        groupMessages[groupId][messageIndex].isRead = true;
-        emit MessageRead(groupId, reader, messageIndex);
     }
 
     function getGroupMessages(bytes32 groupId) external view returns (Message[] memory) {
+        if (deletedGroups[groupId]) {
+            return new Message[](0);
+        }
         return groupMessages[groupId];
     }
 
+    // content hashes of messages start..end-1 of a chat or group, zero for messages stored in full
+    function getMessageHashes(bytes32 chatId, uint256 start, uint256 end) external view returns (bytes32[] memory) {
+        require(end >= start, "Invalid range");
+        bytes32[] memory result = new bytes32[](end - start);
+        for (uint256 i = start; i < end; i++) {
+            result[i - start] = messageHashes[chatId][i];
+        }
+        return result;
+    }
+
     function getUserGroups(address userAddress) external view returns (Group[] memory) {
-        return userGroups[userAddress];
+        bytes32[] storage ids = userGroupIds[userAddress];
+        uint256 count = 0;
+        for (uint256 i = 0; i < ids.length; i++) {
+            if (!deletedGroups[ids[i]]) {
+                count++;
+            }
+        }
+        Group[] memory result = new Group[](count);
+        uint256 next = 0;
+        for (uint256 i = 0; i < ids.length; i++) {
+            if (!deletedGroups[ids[i]]) {
+                result[next++] = groups[ids[i]];
+            }
+        }
+        return result;
+    }
+
+    // length of the user's group id list, ids of deleted groups included until pruned
+    function getUserGroupIdCount(address userAddress) external view returns (uint256) {
+        return userGroupIds[userAddress].length;
+    }
+
+    function getGroupReadCursor(bytes32 groupId, address member) external view returns (uint256) {
+        return groupReadCursors[groupId][member];
+    }
+
+    // read cursor and unread count of every group the member is in, in getUserGroups order
+    function getGroupReadStates(address member) external view returns (bytes32[] memory groupIds, uint256[] memory readCursors, uint256[] memory unreadCounts) {
+        bytes32[] storage ids = userGroupIds[member];
+        uint256 count = 0;
+        for (uint256 i = 0; i < ids.length; i++) {
+            if (!deletedGroups[ids[i]]) {
+                count++;
+            }
+        }
+        groupIds = new bytes32[](count);
+        readCursors = new uint256[](count);
+        unreadCounts = new uint256[](count);
+        uint256 next = 0;
+        for (uint256 i = 0; i < ids.length; i++) {
+            if (!deletedGroups[ids[i]]) {
+                uint256 cursor = groupReadCursors[ids[i]][member];
+                groupIds[next] = ids[i];
+                readCursors[next] = cursor;
+                unreadCounts[next] = groupMessages[ids[i]].length - cursor;
+                next++;
+            }
+        }
+    }
+
+    function isGroupMember(bytes32 groupId, address member) external view returns (bool) {
+        return _isActiveMember(groupId, member);
+    }
+
+    function getGroup(bytes32 groupId) external view returns (Group memory) {
+        require(groups[groupId].groupId != bytes32(0) && !deletedGroups[groupId], "Group not found");
+        return groups[groupId];
     }
 
     function getChatMessages(bytes32 chatId) external view returns (Message[] memory) {
         return chats[chatId].messages;
     }
 
+    // messages between fromTs and toTs (inclusive), along with the index of the first one
+    function getChatMessagesInRange(bytes32 chatId, uint256 fromTs, uint256 toTs) external view returns (uint256, Message[] memory) {
+        return _messagesInRange(chats[chatId].messages, fromTs, toTs);
+    }
+
+    function getGroupMessagesInRange(bytes32 groupId, uint256 fromTs, uint256 toTs) external view returns (uint256, Message[] memory) {
+        if (deletedGroups[groupId]) {
+            return (0, new Message[](0));
+        }
+        return _messagesInRange(groupMessages[groupId], fromTs, toTs);
+    }
+
+    // messages are appended with block.timestamp, so every array is sorted by time
+    // and the first message at or after ts can be found with a binary search
+    function _lowerBound(Message[] storage messages, uint256 ts) private view returns (uint256) {
+        uint256 low = 0;
+        uint256 high = messages.length;
+        while (low < high) {
+            uint256 mid = (low + high) / 2;
+            if (messages[mid].timestamp < ts) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    function _messagesInRange(Message[] storage messages, uint256 fromTs, uint256 toTs) private view returns (uint256, Message[] memory) {
+        uint256 start = _lowerBound(messages, fromTs);
+        uint256 end = toTs == type(uint256).max ? messages.length : _lowerBound(messages, toTs + 1);
+        if (end < start) {
+            end = start;
+        }
+        Message[] memory result = new Message[](end - start);
+        for (uint256 i = start; i < end; i++) {
+            result[i - start] = messages[i];
+        }
+        return (start, result);
+    }
+
 
     function userStatus(address userAddress, string memory newStatus, uint256 _time) external {
         require(users[userAddress].userAddress != address(0), "User not found");
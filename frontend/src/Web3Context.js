@@ -311,7 +311,6 @@ export const Web3Provider = ({ children }) => {
   // Get chat messages
   const getChatMessages = async (user1Address, user2Address) => {
     try {
-      // Ensure consistent address ordering (lexicographically) for chat ID calculation
       const addr1 = ethers.getAddress(user1Address);
       const addr2 = ethers.getAddress(user2Address);
 
@@ -319,90 +318,33 @@ export const Web3Provider = ({ children }) => {
       console.log(`   User 1: ${addr1}`);
       console.log(`   User 2: ${addr2}`);
 
-      // Try both address orders to ensure we get all messages
-      const payload1 = {
+      // Both directions of a conversation share one chat ID, so one call returns
+      // every message in chain order
+      const payload = {
         user1_address: addr1,
         user2_address: addr2,
       };
 
-      const payload2 = {
-        user1_address: addr2,
-        user2_address: addr1,
-      };
-
-      console.log(`📤 Trying payload 1:`, payload1);
-
-      const response1 = await fetch(`${API_BASE_URL}/messages/chat`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify(payload1),
-      });
-
-      const data1 = await response1.json();
-      console.log(`📥 Response 1 status: ${response1.status}`);
-      console.log(`📥 Response 1 data:`, data1);
-
-      let allMessages = [];
-
-      if (response1.ok && data1.messages) {
-        allMessages = [...data1.messages];
-        console.log(`✅ Found ${data1.messages.length} messages with order 1`);
-      }
-
-      // Try reverse order to catch any missed messages
-      console.log(`📤 Trying payload 2:`, payload2);
-
-      const response2 = await fetch(`${API_BASE_URL}/messages/chat`, {
+      const response = await fetch(`${API_BASE_URL}/messages/chat`, {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
         },
-        body: JSON.stringify(payload2),
+        body: JSON.stringify(payload),
       });
 
-      const data2 = await response2.json();
-      console.log(`� Response 2 status: ${response2.status}`);
-      console.log(`📥 Response 2 data:`, data2);
-
-      if (response2.ok && data2.messages) {
-        // Add messages from second call, avoiding duplicates
-        const existingIds = new Set(
-          allMessages.map(
-            (msg) =>
-              msg.id || `${msg.from_address}-${msg.to_address}-${msg.timestamp}`
-          )
-        );
-        const newMessages = data2.messages.filter(
-          (msg) =>
-            !existingIds.has(
-              msg.id || `${msg.from_address}-${msg.to_address}-${msg.timestamp}`
-            )
-        );
-        allMessages = [...allMessages, ...newMessages];
-        console.log(
-          `✅ Found ${data2.messages.length} messages with order 2, ${newMessages.length} new`
-        );
-      }
+      const data = await response.json();
+      console.log(`📥 Response status: ${response.status}`);
 
-      // Sort messages by timestamp
-      allMessages.sort((a, b) => new Date(a.timestamp) - new Date(b.timestamp));
-
-      console.log(`🎯 Total unique messages: ${allMessages.length}`);
-      if (allMessages.length > 0) {
-        console.log(
-          `📋 All message details:`,
-          allMessages.map((msg) => ({
-            from: msg.from_address,
-            to: msg.to_address,
-            content: msg.content,
-            timestamp: msg.timestamp,
-          }))
-        );
+      if (!response.ok) {
+        console.error(`❌ Fetch failed:`, data.detail);
+        toast.error(data.detail || "Failed to load messages");
+        return [];
       }
 
-      return allMessages;
+      const messages = data.messages || [];
+      console.log(`🎯 Total messages: ${messages.length}`);
+      return messages;
     } catch (error) {
       console.error("💥 Error getting chat messages:", error);
       toast.error("Failed to load messages");
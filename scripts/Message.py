@@ -14,10 +14,11 @@ from deploy import deploy, registration, multiple_registrations
 
 
 def calculate_chat_id(user1_address, user2_address):
-    """Calculate chat ID from two user addresses"""
+    """Calculate chat ID from two user addresses (the same for either order)"""
     addr1 = str(user1_address).lower().replace('0x', '') 
     addr2 = str(user2_address).lower().replace('0x', '')
-    packed_data = addr1 + addr2
+    # The contract hashes the two addresses in ascending order
+    packed_data = addr1 + addr2 if addr1 < addr2 else addr2 + addr1
     return web3.keccak(hexstr=packed_data)
 
 
@@ -82,12 +83,10 @@ def get_chat_messages(contract, user1_address, user2_address):
         if len(messages) > 0:
             print(f"📬 Found {len(messages)} message(s):")
             for idx, msg in enumerate(messages):
-                sender = msg[0]
-                content = msg[1]
-                timestamp = msg[2]
-                is_read = msg[3]
-                is_deleted = msg[4]
-                is_media = msg[5]
+                sender, timestamp, flags, content = msg
+                is_read = flags & 1
+                is_deleted = flags & 2
+                is_media = flags & 4
                 
                 status = ""
                 if is_deleted:
@@ -130,6 +129,25 @@ def read_message(contract, user1_address, user2_address, message_index, reader_a
         return False
 
 
+def read_messages_up_to(contract, user1_address, user2_address, message_index, reader_account):
+    """Mark every message up to message_index as read with one transaction"""
+    print(f"\n👁️ Marking messages up to {message_index} as read...")
+    
+    try:
+        # Calculate chat ID
+        chat_id = calculate_chat_id(user1_address, user2_address)
+        
+        # Move the reader's read cursor
+        tx = contract.readMessagesUpTo(chat_id, message_index, {'from': reader_account})
+        print(f"✅ Messages marked as read!")
+        print(f"📄 Transaction hash: {tx.txid}")
+        return True
+        
+    except Exception as e:
+        print(f"❌ Failed to mark messages as read: {str(e)}")
+        return False
+
+
 def send_media_message(contract, from_address, to_address, media_url, sender_account=None):
     """Send a media message (image, video, etc.)"""
     if sender_account is None:
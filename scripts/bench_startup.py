@@ -0,0 +1,84 @@
+"""
+Startup Benchmark Script
+Measure how long `import main` takes for the backend in a fresh interpreter and
+fail when it exceeds a budget, so cold-start regressions are caught before deploy.
+
+Usage:
+    python scripts/bench_startup.py [--runs 5] [--budget 3.0] [--top 15]
+
+Exits with status 1 when the median import time is over the budget (seconds).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+TIMER = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+
+
+def run_import(env, importtime=False):
+    """Import main in a new interpreter, returns (seconds, stderr)"""
+    command = [sys.executable]
+    if importtime:
+        command += ["-X", "importtime"]
+    command += ["-c", TIMER]
+    result = subprocess.run(command, cwd=BACKEND_DIR, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import main failed:\n{result.stderr}")
+    return float(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_output, top):
+    """Top modules by cumulative import time from -X importtime output"""
+    rows = []
+    for line in importtime_output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark backend import time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=float(os.getenv("STARTUP_BUDGET_SECONDS", "3.0")))
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        # Keep the benchmark from touching a real search database
+        env.setdefault("SEARCH_DB_PATH", os.path.join(tmp, "search_index.db"))
+
+        # Warm-up run populates __pycache__ like a built container image would
+        run_import(env)
+        timings = [run_import(env)[0] for _ in range(args.runs)]
+        _, importtime_output = run_import(env, importtime=True)
+
+    median = statistics.median(timings)
+    print("=" * 60)
+    print("Backend Startup Benchmark")
+    print("=" * 60)
+    print(f"Runs:   {args.runs}")
+    print(f"Min:    {min(timings):.3f}s")
+    print(f"Median: {median:.3f}s")
+    print(f"Max:    {max(timings):.3f}s")
+    print(f"Budget: {args.budget:.3f}s")
+
+    print(f"\nSlowest imports (cumulative):")
+    for cumulative_us, self_us, module in slowest_imports(importtime_output, args.top):
+        print(f"   {cumulative_us / 1e6:7.3f}s  (self {self_us / 1e6:.3f}s)  {module}")
+
+    if median > args.budget:
+        print(f"\n❌ Import time {median:.3f}s is over the {args.budget:.3f}s budget")
+        sys.exit(1)
+    print(f"\n✅ Import time within budget")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,6 +3,7 @@ Deployment Helper Script
 Deploy contract and automatically update backend configuration
 """
 from brownie import Whatsapp, accounts, network
+from scripts.export_abi import export_abi
 import json
 import os
 import re
@@ -69,6 +70,9 @@ def deploy_and_configure():
     
     print(f"\n💾 Deployment info saved to: deployment_info.json")
     
+    # Ship an ABI-only module so the backend never parses the full artifact
+    export_abi()
+    
     # Register some test users
     print("\n👥 Registering test users...")
     test_users = [
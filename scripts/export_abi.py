@@ -0,0 +1,46 @@
+"""
+ABI Export Script
+Write the contract ABI from the Brownie build artifact into backend/contract_abi.py
+
+The full artifact also carries bytecode, AST and source maps; the backend only
+needs the ABI, and as a Python module it is byte-compiled once instead of being
+JSON-parsed on every cold start.
+
+Usage:
+    python scripts/export_abi.py
+    brownie run scripts/export_abi.py
+"""
+import json
+import os
+import pprint
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+ARTIFACT_PATH = os.path.join(ROOT_DIR, 'build', 'contracts', 'Whatsapp.json')
+OUTPUT_PATH = os.path.join(ROOT_DIR, 'backend', 'contract_abi.py')
+
+HEADER = '''"""
+Whatsapp contract ABI - generated by scripts/export_abi.py, do not edit.
+Re-run the script after changing and recompiling the contract.
+"""
+'''
+
+
+def export_abi(artifact_path=ARTIFACT_PATH, output_path=OUTPUT_PATH):
+    """Extract the ABI from the artifact and write it as a Python module"""
+    with open(artifact_path, 'r') as f:
+        abi = json.load(f)['abi']
+
+    with open(output_path, 'w') as f:
+        f.write(HEADER)
+        f.write(f"\nABI = {pprint.pformat(abi, width=100, sort_dicts=False)}\n")
+
+    print(f"✅ Exported {len(abi)} ABI entries to {os.path.relpath(output_path, ROOT_DIR)}")
+    return output_path
+
+
+def main():
+    export_abi()
+
+
+if __name__ == "__main__":
+    main()
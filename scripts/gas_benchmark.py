@@ -0,0 +1,162 @@
+"""
+Gas Benchmark Script
+Measure the gas used to create, read and leave groups of 10, 100 and 500 members,
+and to send, read and delete direct and group messages
+
+Usage:
+    brownie run scripts/gas_benchmark.py
+
+Results are written to build/gas_benchmark.json. Run the script on two commits and
+point GAS_BASELINE at the first run's results file to print the difference.
+Sizes can be changed with GAS_BENCH_SIZES (comma separated member counts).
+"""
+from brownie import Whatsapp, accounts, chain, network, web3
+from brownie.convert import to_address
+import json
+import os
+import warnings
+
+# Suppress the pkg_resources warning
+warnings.filterwarnings("ignore", message="pkg_resources is deprecated")
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+REPORT_PATH = os.path.join(ROOT_DIR, 'build', 'gas_benchmark.json')
+SIZES = [int(size) for size in os.getenv("GAS_BENCH_SIZES", "10,100,500").split(",")]
+OPERATIONS = ["create", "read_user_groups", "read_group", "leave"]
+MESSAGE_OPERATIONS = ["send_short", "send_256_bytes", "log_short", "log_256_bytes", "batch_send_10", "read", "read_up_to", "delete", "group_send", "group_read_up_to"]
+
+
+def register_members(contract, account, count, offset):
+    """Register `count` fresh addresses as users, returns their addresses"""
+    members = []
+    for i in range(count):
+        address = to_address("0x" + os.urandom(20).hex())
+        contract.userRegistration(address, f"member{offset + i}", {'from': account})
+        members.append(address)
+    return members
+
+
+def measure(label, func):
+    """Gas used by func(), None when it reverts or does not fit in a block"""
+    try:
+        return func()
+    except Exception as e:
+        print(f"   ⚠️  {label} failed: {str(e).splitlines()[0]}")
+        return None
+
+
+def benchmark_size(contract, account, size, offset):
+    members = register_members(contract, account, size, offset)
+    admin = members[0]
+    results = {}
+
+    # Let large groups use the whole block rather than the configured default
+    results["create"] = measure("create", lambda: contract.createGroup(
+        f"Group {size}", members, "Gas benchmark group", admin, {'from': account, 'gas_limit': chain.block_gas_limit}
+    ).gas_used)
+    if results["create"] is None:
+        return {operation: None for operation in OPERATIONS}
+
+    group_id = contract.getUserGroups(admin)[-1][2]
+    results["read_user_groups"] = measure("read_user_groups", lambda: contract.getUserGroups.estimate_gas(admin))
+    # getGroup does not exist before the storage redesign
+    results["read_group"] = measure("read_group", lambda: contract.getGroup.estimate_gas(group_id)) if hasattr(contract, "getGroup") else None
+    results["leave"] = measure("leave", lambda: contract.leaveGroup(group_id, members[-1], {'from': account}).gas_used)
+    return results
+
+
+def benchmark_messages(contract, account):
+    """Per-message write gas for direct and group messages"""
+    # readMessage checks msg.sender, so the receiver has to be a local account
+    sender, receiver = account.address, accounts[1].address
+    for address in (sender, receiver):
+        contract.userRegistration(address, "Benchmark", {'from': account})
+    # Older contracts have no getChatId and hash the sender first
+    chat_id = contract.getChatId(sender, receiver) if hasattr(contract, "getChatId") else web3.keccak(hexstr=sender[2:] + receiver[2:])
+    results = {}
+
+    results["send_short"] = measure("send_short", lambda: contract.sendMessage(
+        sender, receiver, "hi", False, {'from': account}
+    ).gas_used)
+    results["send_256_bytes"] = measure("send_256_bytes", lambda: contract.sendMessage(
+        sender, receiver, "x" * 256, False, {'from': account}
+    ).gas_used)
+    # logMessage does not exist before log-only messaging
+    for operation, content in (("log_short", "hi"), ("log_256_bytes", "x" * 256)):
+        results[operation] = measure(operation, lambda: contract.logMessage(
+            sender, receiver, content, False, {'from': account}
+        ).gas_used) if hasattr(contract, "logMessage") else None
+    # sendMessages does not exist before batched sends, divide by 10 for the per-message cost
+    results["batch_send_10"] = measure("batch_send_10", lambda: contract.sendMessages(
+        sender, [receiver] * 10, ["hi"] * 10, [False] * 10, {'from': account}
+    ).gas_used) if hasattr(contract, "sendMessages") else None
+    results["read"] = measure("read", lambda: contract.readMessage(chat_id, 0, {'from': accounts[1]}).gas_used)
+    # readMessagesUpTo does not exist before read cursors, it covers every message sent above
+    results["read_up_to"] = measure("read_up_to", lambda: contract.readMessagesUpTo(
+        chat_id, len(contract.getChatMessages(chat_id)) - 1, {'from': accounts[1]}
+    ).gas_used) if hasattr(contract, "readMessagesUpTo") else None
+    results["delete"] = measure("delete", lambda: contract.deleteMessage(chat_id, 1, sender, {'from': account}).gas_used)
+
+    contract.createGroup("Messages", [sender, receiver], "Gas benchmark group", sender, {'from': account})
+    group_id = contract.getUserGroups(sender)[-1][2]
+    results["group_send"] = measure("group_send", lambda: contract.sendGroupMessage(
+        group_id, sender, "hi", False, {'from': account}
+    ).gas_used)
+    # readGroupMessagesUpTo does not exist before per-member read cursors
+    results["group_read_up_to"] = measure("group_read_up_to", lambda: contract.readGroupMessagesUpTo(
+        group_id, 0, {'from': accounts[1]}
+    ).gas_used) if hasattr(contract, "readGroupMessagesUpTo") else None
+    return results
+
+
+def format_gas(value):
+    return f"{value:,}" if value is not None else "n/a"
+
+
+def print_section(title, results, baseline, operations):
+    print(f"\n{title}")
+    for operation in operations:
+        line = f"   {operation:<18} {format_gas(results.get(operation)):>14}"
+        before = baseline.get(operation)
+        after = results.get(operation)
+        if before is not None and after is not None:
+            line += f"   (baseline {before:,}, {(after - before) / before * 100:+.1f}%)"
+        elif baseline:
+            line += f"   (baseline {format_gas(before)})"
+        print(line)
+
+
+def print_report(report, baseline):
+    print("\n" + "=" * 72)
+    print("Gas Benchmark")
+    print("=" * 72)
+    for size, results in report["groups"].items():
+        print_section(f"👥 {size} members", results, baseline.get("groups", {}).get(size, {}), OPERATIONS)
+    print_section("💬 Messages", report["messages"], baseline.get("messages", {}), MESSAGE_OPERATIONS)
+
+
+def main():
+    print(f"Using network: {network.show_active()}")
+    account = accounts[0]
+    contract = Whatsapp.deploy({'from': account})
+    print(f"📍 Contract deployed at {contract.address}")
+
+    report = {"groups": {}}
+    offset = 0
+    for size in SIZES:
+        print(f"\n⛽ Measuring a group of {size} members...")
+        report["groups"][str(size)] = benchmark_size(contract, account, size, offset)
+        offset += size
+    print("\n⛽ Measuring message writes...")
+    report["messages"] = benchmark_messages(contract, account)
+
+    baseline = {}
+    if os.getenv("GAS_BASELINE"):
+        with open(os.getenv("GAS_BASELINE"), 'r') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    os.makedirs(os.path.dirname(REPORT_PATH), exist_ok=True)
+    with open(REPORT_PATH, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Results written to {os.path.relpath(REPORT_PATH, ROOT_DIR)}")
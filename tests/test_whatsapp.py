@@ -1,7 +1,20 @@
-from brownie import Whatsapp, accounts, network
+from brownie import Whatsapp, accounts, network, chain
 from brownie import web3
 import pytest
 
+# Message.flags bits
+FLAG_READ = 1
+FLAG_DELETED = 2
+FLAG_MEDIA = 4
+FLAG_HASHED = 8
+
+
+def chat_id_for(user1_address, user2_address):
+    """Chat ID as the contract computes it: the two addresses in ascending order, packed and hashed"""
+    low, high = sorted([str(user1_address), str(user2_address)], key=lambda address: int(address, 16))
+    return web3.keccak(hexstr=low[2:] + high[2:])
+
+
 @pytest.fixture
 def whatsapp_contract():
     # Deploy the contract before each test
@@ -388,18 +401,16 @@ def test_send_message(whatsapp_contract):
     tx3 = contract.sendMessage(user1_address, user2_address, message_content, is_media, {'from': account1})
     tx3.wait(1)
     
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
 
     # Verify the message was sent correctly
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == 1
     assert messages[0][0] == user1_address  # sender is the first field in Message struct
-    assert messages[0][1] == message_content  # content is the second field in Message struct
-    assert messages[0][4] == False  # isDeleted is the fifth field in Message struct
-    assert messages[0][5] == is_media  # isMedia is the sixth field in Message struct
+    assert messages[0][3] == message_content  # content is the fourth field in Message struct
+    assert messages[0][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+    assert bool(messages[0][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct
 
 
 
@@ -474,18 +485,16 @@ def test_send_message_edge_case(whatsapp_contract):
     tx3.wait(1)
 
     
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
 
     # Verify the message was sent correctly
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == 1
     assert messages[0][0] == user1_address  # sender is the first field in Message struct
-    assert messages[0][1] == message_content  # content is the second field in Message struct (should be empty)
-    assert messages[0][4] == False  # isDeleted is the fifth field in Message struct
-    assert messages[0][5] == is_media  # isMedia is the sixth field in Message struct
+    assert messages[0][3] == message_content  # content is the fourth field in Message struct (should be empty)
+    assert messages[0][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+    assert bool(messages[0][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct
 
 
 def test_send_media_message(whatsapp_contract):
@@ -513,18 +522,16 @@ def test_send_media_message(whatsapp_contract):
     tx3 = contract.sendMessage(user1_address, user2_address, message_content, is_media, {'from': account1})
     tx3.wait(1)
     
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
 
     # Verify the media message was sent correctly
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == 1
     assert messages[0][0] == user1_address  # sender is the first field in Message struct
-    assert messages[0][1] == message_content  # content is the second field in Message struct
-    assert messages[0][4] == False  # isDeleted is the fifth field in Message struct
-    assert messages[0][5] == is_media  # isMedia is the sixth field in Message struct (should be True)
+    assert messages[0][3] == message_content  # content is the fourth field in Message struct
+    assert messages[0][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+    assert bool(messages[0][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct (should be True)
 
 
 
@@ -561,10 +568,8 @@ def test_send_multiple_messages(whatsapp_contract):
         tx.wait(1)
 
     
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
 
     # Verify all messages were sent correctly
     messages = contract.getChatMessages(chat_id)
@@ -572,9 +577,9 @@ def test_send_multiple_messages(whatsapp_contract):
     
     for i, (content, is_media) in enumerate(messages_to_send):
         assert messages[i][0] == user1_address  # sender is the first field in Message struct
-        assert messages[i][1] == content  # content is the second field in Message struct
-        assert messages[i][4] == False  # isDeleted is the fifth field in Message struct
-        assert messages[i][5] == is_media  # isMedia is the sixth field in Message struct
+        assert messages[i][3] == content  # content is the fourth field in Message struct
+        assert messages[i][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+        assert bool(messages[i][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct
 
 
 def test_send_message_after_blocking(whatsapp_contract):
@@ -654,18 +659,16 @@ def test_send_message_after_reregistering(whatsapp_contract):
 
 
     
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
 
     # Verify the message was sent correctly
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == 1
     assert messages[0][0] == user1_address  # sender is the first field in Message struct
-    assert messages[0][1] == message_content  # content is the second field in Message struct
-    assert messages[0][4] == False  # isDeleted is the fifth field in Message struct
-    assert messages[0][5] == is_media  # isMedia is the sixth field in Message struct (should be False) 
+    assert messages[0][3] == message_content  # content is the fourth field in Message struct
+    assert messages[0][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+    assert bool(messages[0][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct (should be False) 
 
 
 
@@ -687,18 +690,16 @@ def test_send_message_to_self(whatsapp_contract):
     tx2 = contract.sendMessage(user1_address, user1_address, message_content, is_media, {'from': account1})
     tx2.wait(1)
 
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user1_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user1_address)
 
     # Verify the message was sent correctly
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == 1
     assert messages[0][0] == user1_address  # sender is the first field in Message struct
-    assert messages[0][1] == message_content  # content is the second field in Message struct
-    assert messages[0][4] == False  # isDeleted is the fifth field in Message struct
-    assert messages[0][5] == is_media  # isMedia is the sixth field in Message struct (should be False)
+    assert messages[0][3] == message_content  # content is the fourth field in Message struct
+    assert messages[0][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+    assert bool(messages[0][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct (should be False)
 
 
 
@@ -816,14 +817,12 @@ def test_send_message_after_blocking_and_reregistering_both(whatsapp_contract):
     tx7.wait(1)
 
     # Calculate the chat ID and verify the message was sent correctly
-    from brownie import web3
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    chat_id = chat_id_for(user1_address, user2_address)
 
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == 1
     assert messages[0][0] == user1_address  # sender
-    assert messages[0][1] == message_content  # content
+    assert messages[0][3] == message_content  # content
 
 
 
@@ -853,18 +852,16 @@ def test_read_message(whatsapp_contract):
     tx3 = contract.sendMessage(user1_address, user2_address, message_content, is_media, {'from': account1})
     tx3.wait(1)
     
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
 
     # Verify the message was sent correctly
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == 1
     assert messages[0][0] == user1_address  # sender is the first field in Message struct
-    assert messages[0][1] == message_content  # content is the second field in Message struct
-    assert messages[0][4] == False  # isDeleted is the fifth field in Message struct
-    assert messages[0][5] == is_media  # isMedia is the sixth field in Message struct (should be False) 
+    assert messages[0][3] == message_content  # content is the fourth field in Message struct
+    assert messages[0][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+    assert bool(messages[0][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct (should be False) 
 
     # Mark the message as read by user2
     tx4 = contract.readMessage(chat_id, 0, {'from': account2})  # Assuming message index is 0
@@ -872,7 +869,7 @@ def test_read_message(whatsapp_contract):
 
     # Verify the message is marked as read
     messages_after_read = contract.getChatMessages(chat_id)
-    assert messages_after_read[0][3] == True  # isRead is the fourth field in Message struct
+    assert messages_after_read[0][2] & FLAG_READ  # read flag in the third field of Message struct
 
 
 
@@ -1257,9 +1254,9 @@ def test_send_group_message(whatsapp_contract):
     group_messages = contract.getGroupMessages(group_id)
     assert len(group_messages) == 1
     assert group_messages[0][0] == user1_address  # sender is the first field in Message struct
-    assert group_messages[0][1] == message_content  # content is the second field in Message struct
-    assert group_messages[0][4] == False  # isDeleted is the fifth field in Message struct
-    assert group_messages[0][5] == is_media  # isMedia is the sixth field in Message struct (should be False)
+    assert group_messages[0][3] == message_content  # content is the fourth field in Message struct
+    assert group_messages[0][2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+    assert bool(group_messages[0][2] & FLAG_MEDIA) == is_media  # media flag in the third field of Message struct (should be False)
 
 def test_send_group_message_by_non_member(whatsapp_contract):
     contract = whatsapp_contract
@@ -1337,17 +1334,15 @@ def test_send_multiple_messages(whatsapp_contract):
         tx = contract.sendMessage(user1_address, user2_address, content, is_media, {'from': account1})
         tx.wait(1)
         # Verify the messages were sent correctly
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
     messages = contract.getChatMessages(chat_id)
     assert len(messages) == len(messages_to_send)
     for i, message in enumerate(messages):
         assert message[0] == user1_address  # sender is the first field in Message struct
-        assert message[1] == messages_to_send[i][0]  # content is the second field in Message struct
-        assert message[4] == False  # isDeleted is the fifth field in Message struct
-        assert message[5] == messages_to_send[i][1]  # isMedia is the sixth field in Message struct (should match sent value)
+        assert message[3] == messages_to_send[i][0]  # content is the fourth field in Message struct
+        assert message[2] & FLAG_DELETED == 0  # flags is the third field in Message struct
+        assert bool(message[2] & FLAG_MEDIA) == messages_to_send[i][1]  # media flag in the third field of Message struct (should match sent value)
 
 
 
@@ -1499,10 +1494,8 @@ def test_archive_chat(whatsapp_contract):
     tx3 = contract.sendMessage(user1_address, user2_address, message_content, is_media, {'from': account1})
     tx3.wait(1)
 
-    # Create the packed encoding like abi.encodePacked in Solidity
-    # Remove '0x' prefix and concatenate the hex strings, then hash
-    packed_data = user1_address.lower().replace('0x', '') + user2_address.lower().replace('0x', '')
-    chat_id = web3.keccak(hexstr=packed_data)
+    # One chat per pair of users, whichever of them sends
+    chat_id = chat_id_for(user1_address, user2_address)
 
     # Archive the chat (correct parameter order: chatId, userAddress, isArchived)
     tx4 = contract.archiveChat(chat_id, user1_address, True, {'from': account1})
@@ -1518,3 +1511,452 @@ def test_archive_chat(whatsapp_contract):
     # Again, verify the transaction succeeded by checking no revert occurred
 
 
+def test_get_chat_messages_in_range(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+
+    user1_address = account1.address
+    user2_address = account2.address
+
+    contract.userRegistration(user1_address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(user2_address, "Alice", {'from': account2}).wait(1)
+
+    # Send three messages roughly a day apart
+    timestamps = []
+    for content in ["first", "second", "third"]:
+        tx = contract.sendMessage(user1_address, user2_address, content, False, {'from': account1})
+        tx.wait(1)
+        timestamps.append(tx.timestamp)
+        chain.sleep(86400)
+        chain.mine()
+
+    chat_id = chat_id_for(user1_address, user2_address)
+
+    # Only the middle message falls within its own timestamp
+    start_index, messages = contract.getChatMessagesInRange(chat_id, timestamps[1], timestamps[1])
+    assert start_index == 1
+    assert len(messages) == 1
+    assert messages[0][3] == "second"
+
+    # Open-ended range from the second message onwards
+    start_index, messages = contract.getChatMessagesInRange(chat_id, timestamps[1], 2 ** 256 - 1)
+    assert start_index == 1
+    assert [m[3] for m in messages] == ["second", "third"]
+
+    # Range before the first message is empty
+    start_index, messages = contract.getChatMessagesInRange(chat_id, 0, timestamps[0] - 1)
+    assert start_index == 0
+    assert len(messages) == 0
+
+
+def test_get_group_messages_in_range(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+
+    user1_address = account1.address
+    user2_address = account2.address
+
+    contract.userRegistration(user1_address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(user2_address, "Alice", {'from': account2}).wait(1)
+
+    members = [user1_address, user2_address]
+    contract.createGroup("Friends", members, "A group for friends", user1_address, {'from': account1}).wait(1)
+    group_id = contract.getUserGroups(user1_address)[0][2]
+
+    timestamps = []
+    for content in ["morning", "evening"]:
+        tx = contract.sendGroupMessage(group_id, user1_address, content, False, {'from': account1})
+        tx.wait(1)
+        timestamps.append(tx.timestamp)
+        chain.sleep(3600)
+        chain.mine()
+
+    start_index, messages = contract.getGroupMessagesInRange(group_id, timestamps[0] + 1, 2 ** 256 - 1)
+    assert start_index == 1
+    assert len(messages) == 1
+    assert messages[0][3] == "evening"
+
+
+def _create_three_member_group(contract):
+    account1, account2, account3 = accounts[0], accounts[1], accounts[2]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+    contract.userRegistration(account3.address, "Bob", {'from': account3}).wait(1)
+    members = [account1.address, account2.address, account3.address]
+    contract.createGroup("Friends", members, "A group for friends", account1.address, {'from': account1}).wait(1)
+    return contract.getUserGroups(account1.address)[0][2]
+
+
+def test_get_group(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+
+    group = contract.getGroup(group_id)
+    assert group[0] == "Friends"
+    assert group[2] == group_id
+    assert group[3] == "A group for friends"
+    assert group[4] == accounts[0].address
+    assert len(group[1]) == 3
+
+    with pytest.raises(Exception):
+        contract.getGroup("0x" + "00" * 31 + "01")
+
+
+def test_change_group_admin_seen_by_all_members(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+
+    contract.changeGroupAdmin(group_id, accounts[1].address, accounts[0].address, {'from': accounts[0]}).wait(1)
+
+    # The group is stored once, so every member sees the new admin
+    for account in accounts[:3]:
+        assert contract.getUserGroups(account.address)[0][4] == accounts[1].address
+
+
+def test_leave_group(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+
+    contract.leaveGroup(group_id, accounts[2].address, {'from': accounts[2]}).wait(1)
+
+    assert len(contract.getUserGroups(accounts[2].address)) == 0
+    members = contract.getGroup(group_id)[1]
+    assert len(members) == 2
+    assert accounts[2].address not in members
+    assert accounts[2].address not in contract.getUserGroups(accounts[0].address)[0][1]
+
+    # Former members can no longer post or leave again
+    with pytest.raises(Exception):
+        contract.sendGroupMessage(group_id, accounts[2].address, "Still here?", False, {'from': accounts[2]})
+    with pytest.raises(Exception):
+        contract.leaveGroup(group_id, accounts[2].address, {'from': accounts[2]})
+
+
+def test_delete_group(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+    contract.sendGroupMessage(group_id, accounts[1].address, "Hello", False, {'from': accounts[1]}).wait(1)
+
+    # Only the admin can delete
+    with pytest.raises(Exception):
+        contract.deleteGroup(group_id, accounts[1].address, {'from': accounts[1]})
+
+    contract.deleteGroup(group_id, accounts[0].address, {'from': accounts[0]}).wait(1)
+
+    for account in accounts[:3]:
+        assert len(contract.getUserGroups(account.address)) == 0
+    assert len(contract.getGroupMessages(group_id)) == 0
+    with pytest.raises(Exception):
+        contract.getGroup(group_id)
+
+
+def test_is_group_member(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+
+    for account in accounts[:3]:
+        assert contract.isGroupMember(group_id, account.address)
+    assert not contract.isGroupMember(group_id, accounts[3].address)
+
+    contract.leaveGroup(group_id, accounts[1].address, {'from': accounts[1]}).wait(1)
+    assert not contract.isGroupMember(group_id, accounts[1].address)
+
+    contract.deleteGroup(group_id, accounts[0].address, {'from': accounts[0]}).wait(1)
+    assert not contract.isGroupMember(group_id, accounts[0].address)
+    assert not contract.isGroupMember(group_id, accounts[2].address)
+
+
+def test_create_group_with_duplicate_member(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+
+    members = [account1.address, account2.address, account2.address]
+    with pytest.raises(Exception):
+        contract.createGroup("Friends", members, "A group for friends", account1.address, {'from': account1})
+
+
+def test_deleted_group_rejects_activity(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+    contract.sendGroupMessage(group_id, accounts[1].address, "Hello", False, {'from': accounts[1]}).wait(1)
+
+    tx = contract.deleteGroup(group_id, accounts[0].address, {'from': accounts[0]})
+    tx.wait(1)
+    assert tx.events["GroupDeleted"]["groupId"] == group_id
+
+    with pytest.raises(Exception):
+        contract.sendGroupMessage(group_id, accounts[1].address, "Anyone?", False, {'from': accounts[1]})
+    with pytest.raises(Exception):
+        contract.readGroupMessagesUpTo(group_id, 0, {'from': accounts[2]})
+    with pytest.raises(Exception):
+        contract.leaveGroup(group_id, accounts[2].address, {'from': accounts[2]})
+    with pytest.raises(Exception):
+        contract.deleteGroup(group_id, accounts[0].address, {'from': accounts[0]})
+    start_index, messages = contract.getGroupMessagesInRange(group_id, 0, 2 ** 256 - 1)
+    assert len(messages) == 0
+
+
+def test_prune_deleted_groups(whatsapp_contract):
+    contract = whatsapp_contract
+    deleted_id = _create_three_member_group(contract)
+    members = [accounts[0].address, accounts[1].address]
+    contract.createGroup("Work", members, "A group for work", accounts[0].address, {'from': accounts[0]}).wait(1)
+
+    contract.deleteGroup(deleted_id, accounts[0].address, {'from': accounts[0]}).wait(1)
+    # deletion leaves the id in every member's list, only the views skip it
+    assert contract.getUserGroupIdCount(accounts[0].address) == 2
+    assert contract.getUserGroupIdCount(accounts[2].address) == 1
+    assert len(contract.getUserGroups(accounts[0].address)) == 1
+
+    contract.pruneDeletedGroups(accounts[0].address, {'from': accounts[0]}).wait(1)
+    assert contract.getUserGroupIdCount(accounts[0].address) == 1
+    assert contract.getUserGroupIdCount(accounts[2].address) == 1
+
+    groups = contract.getUserGroups(accounts[0].address)
+    assert len(groups) == 1
+    assert groups[0][0] == "Work"
+
+
+def test_message_flags_are_packed(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+
+    tx = contract.sendMessage(account1.address, account2.address, "ipfs://photo", True, {'from': account1})
+    tx.wait(1)
+    chat_id = chat_id_for(account1.address, account2.address)
+
+    contract.readMessage(chat_id, 0, {'from': account2}).wait(1)
+    contract.deleteMessage(chat_id, 0, account1.address, {'from': account1}).wait(1)
+
+    sender, timestamp, flags, content = contract.getChatMessages(chat_id)[0]
+    assert sender == account1.address
+    assert timestamp == tx.timestamp
+    assert flags == FLAG_READ | FLAG_DELETED | FLAG_MEDIA
+    assert content == "ipfs://photo"
+
+
+def test_send_message_hash(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+
+    contract.sendMessage(account1.address, account2.address, "stored in full", False, {'from': account1}).wait(1)
+    content_hash = web3.keccak(text="kept off chain")
+    tx = contract.sendMessageHash(account1.address, account2.address, content_hash, True, {'from': account1})
+    tx.wait(1)
+
+    chat_id = chat_id_for(account1.address, account2.address)
+    assert tx.events["MessageHashSent"]["chatId"] == chat_id
+    assert tx.events["MessageHashSent"]["contentHash"] == content_hash
+    assert tx.events["MessageHashSent"]["messageIndex"] == 1
+
+    messages = contract.getChatMessages(chat_id)
+    assert len(messages) == 2
+    assert messages[1][2] == FLAG_HASHED | FLAG_MEDIA
+    assert messages[1][3] == ""
+
+    hashes = contract.getMessageHashes(chat_id, 0, 2)
+    assert hashes[0] == "0x" + "00" * 32
+    assert hashes[1] == content_hash.hex()
+
+    # Unregistered receivers are rejected like in sendMessage
+    with pytest.raises(Exception):
+        contract.sendMessageHash(account1.address, accounts[5].address, content_hash, False, {'from': account1})
+
+
+def test_send_group_message_hash(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+    content_hash = web3.keccak(text="kept off chain")
+
+    contract.sendGroupMessageHash(group_id, accounts[1].address, content_hash, False, {'from': accounts[1]}).wait(1)
+
+    messages = contract.getGroupMessages(group_id)
+    assert messages[0][2] == FLAG_HASHED
+    assert contract.getMessageHashes(group_id, 0, 1)[0] == content_hash.hex()
+
+    with pytest.raises(Exception):
+        contract.sendGroupMessageHash(group_id, accounts[3].address, content_hash, False, {'from': accounts[3]})
+
+
+def test_log_message(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+
+    tx = contract.logMessage(account1.address, account2.address, "only in the logs", False, {'from': account1})
+    tx.wait(1)
+
+    chat_id = chat_id_for(account1.address, account2.address)
+    assert tx.events["MessageSent"]["chatId"] == chat_id
+    assert tx.events["MessageSent"]["content"] == "only in the logs"
+    # Nothing is written to the chat
+    assert len(contract.getChatMessages(chat_id)) == 0
+
+    with pytest.raises(Exception):
+        contract.logMessage(account1.address, accounts[5].address, "nobody there", False, {'from': account1})
+
+
+def test_log_group_message(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+
+    tx = contract.logGroupMessage(group_id, accounts[1].address, "only in the logs", True, {'from': accounts[1]})
+    tx.wait(1)
+    assert tx.events["MessageSent"]["chatId"] == group_id
+    assert len(contract.getGroupMessages(group_id)) == 0
+
+    with pytest.raises(Exception):
+        contract.logGroupMessage(group_id, accounts[3].address, "not a member", False, {'from': accounts[3]})
+
+
+def test_send_messages_batch(whatsapp_contract):
+    contract = whatsapp_contract
+    account1, account2, account3 = accounts[0], accounts[1], accounts[2]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+    contract.userRegistration(account3.address, "Bob", {'from': account3}).wait(1)
+
+    tx = contract.sendMessages(
+        account1.address,
+        [account2.address, account2.address, account3.address],
+        ["first", "second", "third"],
+        [False, True, False],
+        {'from': account1}
+    )
+    tx.wait(1)
+    assert len(tx.events["MessageSent"]) == 3
+
+    chat_id_2 = chat_id_for(account1.address, account2.address)
+    chat_id_3 = chat_id_for(account1.address, account3.address)
+    messages = contract.getChatMessages(chat_id_2)
+    assert [message[3] for message in messages] == ["first", "second"]
+    assert messages[0][2] == 0
+    assert messages[1][2] == FLAG_MEDIA
+    assert contract.getChatMessages(chat_id_3)[0][3] == "third"
+
+    with pytest.raises(Exception):
+        contract.sendMessages(account1.address, [account2.address], ["a", "b"], [False, False], {'from': account1})
+    with pytest.raises(Exception):
+        contract.sendMessages(account1.address, [], [], [], {'from': account1})
+    with pytest.raises(Exception):
+        contract.sendMessages(account1.address, [account2.address, accounts[4].address], ["a", "b"], [False, False], {'from': account1})
+
+
+def test_send_group_messages_batch(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+
+    tx = contract.sendGroupMessages(group_id, accounts[1].address, ["one", "two"], [False, True], {'from': accounts[1]})
+    tx.wait(1)
+    assert len(tx.events["MessageSent"]) == 2
+
+    messages = contract.getGroupMessages(group_id)
+    assert [message[3] for message in messages] == ["one", "two"]
+    assert messages[1][2] == FLAG_MEDIA
+
+    with pytest.raises(Exception):
+        contract.sendGroupMessages(group_id, accounts[3].address, ["not a member"], [False], {'from': accounts[3]})
+    with pytest.raises(Exception):
+        contract.sendGroupMessages(group_id, accounts[1].address, ["one"], [False, True], {'from': accounts[1]})
+
+
+def test_read_messages_up_to(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+    for content in ["one", "two", "three"]:
+        contract.sendMessage(account1.address, account2.address, content, False, {'from': account1}).wait(1)
+    chat_id = chat_id_for(account1.address, account2.address)
+    assert contract.getReadCursor(chat_id, account2.address) == 0
+
+    tx = contract.readMessagesUpTo(chat_id, 1, {'from': account2})
+    tx.wait(1)
+    assert tx.events["MessagesReadUpTo"]["reader"] == account2.address
+    assert contract.getReadCursor(chat_id, account2.address) == 2
+    assert contract.getReadCursor(chat_id, account1.address) == 0
+
+    # The cursor never moves backwards
+    contract.readMessagesUpTo(chat_id, 0, {'from': account2}).wait(1)
+    assert contract.getReadCursor(chat_id, account2.address) == 2
+
+    with pytest.raises(Exception):
+        contract.readMessagesUpTo(chat_id, 3, {'from': account2})
+    with pytest.raises(Exception):
+        contract.readMessagesUpTo(chat_id, 0, {'from': accounts[3]})
+
+
+def test_group_read_cursors(whatsapp_contract):
+    contract = whatsapp_contract
+    group_id = _create_three_member_group(contract)
+    for content in ["one", "two", "three"]:
+        contract.sendGroupMessage(group_id, accounts[0].address, content, False, {'from': accounts[0]}).wait(1)
+
+    tx = contract.readGroupMessagesUpTo(group_id, 1, {'from': accounts[1]})
+    tx.wait(1)
+    assert tx.events["MessagesReadUpTo"]["chatId"] == group_id
+
+    # Each member has its own cursor
+    assert contract.getGroupReadCursor(group_id, accounts[1].address) == 2
+    assert contract.getGroupReadCursor(group_id, accounts[2].address) == 0
+
+    group_ids, read_cursors, unread_counts = contract.getGroupReadStates(accounts[1].address)
+    assert list(group_ids) == [group_id]
+    assert list(read_cursors) == [2]
+    assert list(unread_counts) == [1]
+    assert list(contract.getGroupReadStates(accounts[2].address)[2]) == [3]
+
+    # The cursor never moves backwards
+    contract.readGroupMessagesUpTo(group_id, 0, {'from': accounts[1]}).wait(1)
+    assert contract.getGroupReadCursor(group_id, accounts[1].address) == 2
+
+    with pytest.raises(Exception):
+        contract.readGroupMessagesUpTo(group_id, 3, {'from': accounts[1]})
+    with pytest.raises(Exception):
+        contract.readGroupMessagesUpTo(group_id, 0, {'from': accounts[3]})
+
+
+def test_chat_is_shared_by_both_directions(whatsapp_contract):
+    contract = whatsapp_contract
+    account1 = accounts[0]
+    account2 = accounts[1]
+    contract.userRegistration(account1.address, "Willy", {'from': account1}).wait(1)
+    contract.userRegistration(account2.address, "Alice", {'from': account2}).wait(1)
+
+    tx1 = contract.sendMessage(account1.address, account2.address, "Hi Alice", False, {'from': account1})
+    tx1.wait(1)
+    tx2 = contract.sendMessage(account2.address, account1.address, "Hi Willy", False, {'from': account2})
+    tx2.wait(1)
+
+    chat_id = chat_id_for(account1.address, account2.address)
+    assert contract.getChatId(account1.address, account2.address) == chat_id
+    assert contract.getChatId(account2.address, account1.address) == chat_id
+    assert tx1.events["MessageSent"]["chatId"] == chat_id
+    assert tx2.events["MessageSent"]["chatId"] == chat_id
+
+    messages = contract.getChatMessages(chat_id)
+    assert [message[3] for message in messages] == ["Hi Alice", "Hi Willy"]
+    assert messages[1][0] == account2.address
+
+    # Either participant can read and delete their own messages, whoever started the chat
+    contract.readMessage(chat_id, 1, {'from': account1}).wait(1)
+    contract.readMessage(chat_id, 0, {'from': account2}).wait(1)
+    contract.deleteMessage(chat_id, 1, account2.address, {'from': account2}).wait(1)
+    messages = contract.getChatMessages(chat_id)
+    assert messages[0][2] & FLAG_READ
+    assert messages[1][2] & FLAG_READ
+    assert messages[1][2] & FLAG_DELETED